@@ -1,18 +1,42 @@
+import time
+
+# Точка отсчета для метрик холодного старта (до импорта тяжелых модулей)
+PROCESS_STARTED = time.monotonic()
+
 import os
 import logging
 import asyncio
+import shutil
+import zipfile
 from pathlib import Path
-from typing import Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Document
+from contextlib import ExitStack
+from typing import Optional, List, Tuple
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, Document, InputMediaDocument
+)
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, filters
+    TypeHandler, ContextTypes, filters
 )
 from telegram.constants import ParseMode
 from telegram.error import TimedOut, NetworkError
 
-from config import BOT_TOKEN, MAX_FILE_SIZE, TEMP_DIR, SUPPORTED_FORMATS, TIMEOUT_SETTINGS
-from pdf_converter import PDFConverter
+from config import (
+    BOT_TOKEN, MAX_FILE_SIZE, TEMP_DIR, SUPPORTED_FORMATS, TIMEOUT_SETTINGS,
+    BOT_API_SETTINGS, QUEUE_SETTINGS, RATE_LIMIT_SETTINGS, BATCH_SETTINGS, PAGE_RANGE_BUTTONS,
+    TEXT_DELIVERY_SETTINGS, PROGRESS_SETTINGS, IMAGE_EXPORT_SETTINGS, COMPRESS_SETTINGS,
+    SESSION_SETTINGS, TRACE_SETTINGS
+)
+from pdf_converter import PDFConverter, ConversionCancelled
+from utils import (
+    FileManager, SessionStore, RateLimiter, EditThrottle, ProgressReporter,
+    format_duration, parse_page_range, format_page_range, sanitize_filename
+)
+from cost_model import CostModel
+from task_queue import ConversionQueue
+from worker_pool import ConversionPool, MemoryLimitExceeded, WorkerError
+from pipeline import Pipeline, PipelineJob
+from tracing import TraceRecorder
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,67 +45,207 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MEMORY_LIMIT_MESSAGE = (
+    "🧠 <b>Превышен лимит памяти!</b>\n\n"
+    "Файл слишком сложный для обработки: конвертация остановлена.\n"
+    "Попробуйте отправить файл меньшего размера или с меньшим числом страниц."
+)
+
 class PDFBot:
     """Telegram бот для конвертации PDF файлов"""
     
     def __init__(self):
         self.converter = PDFConverter(TEMP_DIR)
+        # Тяжелая конвертация выполняется в отдельных процессах с лимитом памяти
+        self.pool = ConversionPool(TEMP_DIR)
+        self.cost_model = CostModel()
+        # Метрики холодного старта: первое обновление и первая конвертация
+        self.first_update_logged = False
+        self.first_conversion_logged = False
+        self.rate_limiter = RateLimiter(
+            RATE_LIMIT_SETTINGS['capacity'],
+            RATE_LIMIT_SETTINGS['refill_per_hour']
+        ) if RATE_LIMIT_SETTINGS['enabled'] else None
+        # Прогресс конвертации: правки статуса не чаще раза в edit_interval на чат
+        self.edit_throttle = EditThrottle(PROGRESS_SETTINGS['edit_interval'])
+        self.progress_reporters = {}
+        # Загруженный файл и собираемый пакет пользователя между сообщениями
+        self.sessions = SessionStore(
+            SESSION_SETTINGS['ttl'],
+            SESSION_SETTINGS['max_entries'],
+            SESSION_SETTINGS['db_path'] or None,
+            SESSION_SETTINGS['cache_entries'],
+            SESSION_SETTINGS['cleanup_every']
+        )
+        # Отмена выполняющихся задач: (chat_id, message_id статуса) -> событие
+        self.cancel_tokens = {}
+        # Скачивание, конвертация и отправка - отдельные этапы со своими лимитами
+        self.pipeline = Pipeline()
+        # Анонимные трассы задач для планирования мощностей (replay.py)
+        self.tracer = TraceRecorder(TRACE_SETTINGS['path']) if TRACE_SETTINGS['enabled'] else None
         self.temp_dir = Path(TEMP_DIR)
         self.temp_dir.mkdir(exist_ok=True)
+        # При включенной очереди конвертацию выполняют отдельные воркеры (worker.py)
+        self.queue = ConversionQueue(QUEUE_SETTINGS['db_path']) if QUEUE_SETTINGS['enabled'] else None
+    
+    async def _download_file_with_timeout(self, bot, file_id: str, file_path: Path) -> Optional[Path]:
+        """Скачивает файл с таймаутом.
+
+        Возвращает путь к PDF для обработки. В локальном режиме Bot API сервер
+        отдает абсолютный путь к уже сохраненному файлу - тогда файл
+        открывается напрямую, без копирования.
+        """
+        async with self.pipeline.download.slot():
+            try:
+                # Получаем информацию о файле с таймаутом
+                file = await asyncio.wait_for(
+                    bot.get_file(file_id),
+                    timeout=TIMEOUT_SETTINGS['telegram_request']
+                )
+                
+                local_path = self._local_file_path(file.file_path)
+                if local_path:
+                    return local_path
+                
+                # Скачиваем файл с таймаутом
+                await asyncio.wait_for(
+                    file.download_to_drive(file_path),
+                    timeout=TIMEOUT_SETTINGS['file_download']
+                )
+                
+                return file_path
+                
+            except asyncio.TimeoutError:
+                logger.error(f"Таймаут при скачивании файла {file_id}")
+                return None
+            except (TimedOut, NetworkError) as e:
+                logger.error(f"Ошибка сети при скачивании файла: {e}")
+                return None
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при скачивании файла: {e}")
+                return None
+    
+    @staticmethod
+    def _local_file_path(file_path: Optional[str]) -> Optional[Path]:
+        """Возвращает путь к файлу на диске Bot API сервера (только локальный режим)"""
+        if not BOT_API_SETTINGS['local_mode'] or not file_path:
+            return None
+        path = Path(file_path)
+        if path.is_absolute() and path.is_file():
+            return path
+        return None
+    
+    def _job_path(self, job: dict, file_name: str) -> Path:
+        """Путь к скачанному файлу задачи во временной папке.
+
+        Задачи выполняются параллельно, поэтому имя получает префикс
+        сообщения со статусом: одинаковые имена файлов разных
+        пользователей не перезаписывают и не удаляют друг друга.
+        """
+        return self.temp_dir / f"{job['chat_id']}_{job['message_id']}_{sanitize_filename(file_name)}"
+    
+    def _job_dir(self, job: dict) -> Path:
+        """Папка результатов задачи (удаляется в _finish_job)"""
+        return self.temp_dir / f"job_{job['chat_id']}_{job['message_id']}"
     
-    async def _download_file_with_timeout(self, bot, file_id: str, file_path: Path) -> bool:
-        """Скачивает файл с таймаутом"""
+    def _output_path(self, job: dict, file_name: str) -> Path:
+        """Путь к результату задачи в ее отдельной папке.
+
+        Локальный сервер Bot API берет имя отправленного файла из пути,
+        поэтому результат сохраняется под своим именем, без префикса.
+        """
+        directory = self._job_dir(job)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / sanitize_filename(file_name)
+    
+    def _is_owned_file(self, file_path: Path) -> bool:
+        """Проверяет, что файл лежит во временной папке бота и его можно удалять"""
         try:
-            # Получаем информацию о файле с таймаутом
-            file = await asyncio.wait_for(
-                bot.get_file(file_id),
-                timeout=TIMEOUT_SETTINGS['telegram_request']
-            )
-            
-            # Скачиваем файл с таймаутом
-            await asyncio.wait_for(
-                file.download_to_drive(file_path),
-                timeout=TIMEOUT_SETTINGS['file_download']
-            )
-            
+            file_path.resolve().relative_to(self.temp_dir.resolve())
             return True
-            
-        except asyncio.TimeoutError:
-            logger.error(f"Таймаут при скачивании файла {file_id}")
-            return False
-        except (TimedOut, NetworkError) as e:
-            logger.error(f"Ошибка сети при скачивании файла: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при скачивании файла: {e}")
+        except ValueError:
             return False
     
     async def _send_file_with_timeout(self, bot, chat_id: int, file_path: Path, 
                                     filename: str, caption: str) -> bool:
         """Отправляет файл с таймаутом"""
-        try:
-            with open(file_path, 'rb') as file:
-                await asyncio.wait_for(
-                    bot.send_document(
-                        chat_id=chat_id,
-                        document=file,
-                        filename=filename,
-                        caption=caption,
-                        parse_mode=ParseMode.HTML
-                    ),
-                    timeout=TIMEOUT_SETTINGS['file_upload']
-                )
-            return True
-            
-        except asyncio.TimeoutError:
-            logger.error(f"Таймаут при отправке файла {filename}")
-            return False
-        except (TimedOut, NetworkError) as e:
-            logger.error(f"Ошибка сети при отправке файла: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при отправке файла: {e}")
-            return False
+        async with self.pipeline.upload.slot():
+            try:
+                if BOT_API_SETTINGS['local_mode'] and BOT_API_SETTINGS['upload_by_path']:
+                    # Локальный сервер читает файл с диска сам (file:// URI)
+                    await asyncio.wait_for(
+                        bot.send_document(
+                            chat_id=chat_id,
+                            document=Path(file_path).resolve(),
+                            filename=filename,
+                            caption=caption,
+                            parse_mode=ParseMode.HTML
+                        ),
+                        timeout=TIMEOUT_SETTINGS['file_upload']
+                    )
+                    return True
+                
+                with open(file_path, 'rb') as file:
+                    await asyncio.wait_for(
+                        bot.send_document(
+                            chat_id=chat_id,
+                            document=file,
+                            filename=filename,
+                            caption=caption,
+                            parse_mode=ParseMode.HTML
+                        ),
+                        timeout=TIMEOUT_SETTINGS['file_upload']
+                    )
+                return True
+                
+            except asyncio.TimeoutError:
+                logger.error(f"Таймаут при отправке файла {filename}")
+                return False
+            except (TimedOut, NetworkError) as e:
+                logger.error(f"Ошибка сети при отправке файла: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при отправке файла: {e}")
+                return False
+    
+    async def _send_files_with_timeout(self, bot, chat_id: int, files: List[Tuple[Path, str]],
+                                       caption: str) -> bool:
+        """Отправляет несколько файлов одним альбомом с таймаутом"""
+        if len(files) == 1:
+            path, name = files[0]
+            return await self._send_file_with_timeout(bot, chat_id, path, name, caption)
+        
+        async with self.pipeline.upload.slot():
+            try:
+                with ExitStack() as stack:
+                    media = []
+                    for index, (path, name) in enumerate(files):
+                        if BOT_API_SETTINGS['local_mode'] and BOT_API_SETTINGS['upload_by_path']:
+                            source = Path(path).resolve()
+                        else:
+                            source = stack.enter_context(open(path, 'rb'))
+                        # Подпись альбома - у последнего документа
+                        media.append(InputMediaDocument(
+                            source,
+                            filename=name,
+                            caption=caption if index == len(files) - 1 else None,
+                            parse_mode=ParseMode.HTML
+                        ))
+                    await asyncio.wait_for(
+                        bot.send_media_group(chat_id=chat_id, media=media),
+                        timeout=TIMEOUT_SETTINGS['file_upload']
+                    )
+                return True
+                
+            except asyncio.TimeoutError:
+                logger.error(f"Таймаут при отправке файлов в чат {chat_id}")
+                return False
+            except (TimedOut, NetworkError) as e:
+                logger.error(f"Ошибка сети при отправке файлов: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при отправке файлов: {e}")
+                return False
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -124,7 +288,7 @@ class PDFBot:
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
-        help_text = """
+        help_text = f"""
 📖 <b>Справка по использованию бота</b>
 
 <b>Поддерживаемые форматы:</b>
@@ -141,10 +305,33 @@ class PDFBot:
 <b>📊 PDF → Excel:</b>
 • Извлечение всех таблиц
 • Сохранение структуры данных
+• Числа (в том числе с запятой) и даты - как числа и даты Excel
 • Создание отдельных листов для каждой страницы
 
+<b>🧾 Таблицы → CSV / Parquet:</b>
+• Быстрее Excel: без создания листов
+• CSV - ZIP-архив, по файлу на таблицу
+• Parquet - один файл: страница, таблица, строка, колонка, заголовок, значение
+
+<b>🗂 Все форматы:</b>
+• Word, Excel и текст за одну обработку
+• Файлы приходят одним альбомом
+
+<b>🖼 Изображения страниц:</b>
+• PNG, JPEG или WebP с выбранным разрешением
+• До {IMAGE_EXPORT_SETTINGS['media_group_limit']} страниц - альбомом, больше - ZIP-архивом
+
+<b>🗜 Сжать PDF:</b>
+• Изображения уменьшаются до {COMPRESS_SETTINGS['dpi']} DPI и пережимаются в JPEG
+• Шрифты урезаются до используемых символов
+• В ответе - размер до и после сжатия
+
+<b>📑 Часть документа:</b>
+• Кнопки «Первые N стр.» в меню файла
+• Или ответьте диапазоном: 5-12, 7, 10- (до конца)
+
 <b>Ограничения:</b>
-• Максимальный размер файла: 20MB
+• Максимальный размер файла: {MAX_FILE_SIZE // (1024*1024)}MB
 • Поддерживаются только PDF файлы
 
 <b>Как использовать:</b>
@@ -197,6 +384,10 @@ class PDFBot:
             )
             return
         
+        # Проверяем квоту пользователя
+        if not await self._check_rate_limit(update.message, update.effective_user.id):
+            return
+        
         # Проверяем размер файла
         if document.file_size > MAX_FILE_SIZE:
             await update.message.reply_text(
@@ -206,29 +397,202 @@ class PDFBot:
             )
             return
         
-        # Сохраняем информацию о файле в контексте
-        context.user_data['current_file'] = {
+        # Сохраняем информацию о файле в сессии пользователя
+        user_id = update.effective_user.id
+        file_info = {
             'file_id': document.file_id,
             'file_name': document.file_name,
             'file_size': document.file_size
         }
+        self.sessions.set(user_id, 'current_file', file_info)
+        
+        # Документы одного альбома или присланные подряд собираем в пакет
+        batch = self.sessions.get(user_id, 'batch')
+        media_group_id = update.message.media_group_id
+        # Время по часам системы: сессия может пережить перезапуск
+        now = time.time()
+        if batch and len(batch['files']) < BATCH_SETTINGS['max_files'] and (
+                (media_group_id and media_group_id == batch['media_group_id']) or
+                now - batch['updated_at'] <= BATCH_SETTINGS['window']):
+            batch['files'].append(file_info)
+            batch['updated_at'] = now
+            if not batch['menu_update_pending']:
+                batch['menu_update_pending'] = True
+                context.application.create_task(
+                    self._update_batch_menu(context.bot, update.effective_chat.id, user_id, batch)
+                )
+            self.sessions.set(user_id, 'batch', batch)
+            return
+        
+        # Превью первой страницы готовим в фоне, меню показываем сразу
+        if BOT_API_SETTINGS['local_mode'] or document.file_size <= IMAGE_EXPORT_SETTINGS['preview_max_file_size']:
+            context.application.create_task(self._send_preview(context.bot, update.message, file_info))
         
         # Показываем меню выбора типа конвертации
+        menu_message = await update.message.reply_text(
+            f"📁 <b>Файл получен:</b> {document.file_name}\n"
+            f"📏 <b>Размер:</b> {document.file_size // 1024} KB\n\n"
+            f"Выберите тип конвертации.\n"
+            f"Чтобы обработать часть документа, выберите первые страницы "
+            f"или отправьте диапазон, например <code>5-12</code>.",
+            parse_mode=ParseMode.HTML,
+            reply_markup=self._conversion_keyboard()
+        )
+        
+        self.sessions.set(user_id, 'batch', {
+            'files': [file_info],
+            'menu_message_id': menu_message.message_id,
+            'media_group_id': media_group_id,
+            'updated_at': now,
+            'menu_update_pending': False
+        })
+    
+    @staticmethod
+    def _conversion_keyboard() -> InlineKeyboardMarkup:
+        """Меню выбора типа конвертации для одного файла"""
         keyboard = [
             [InlineKeyboardButton("📄 PDF → Word", callback_data="convert_word")],
             [InlineKeyboardButton("📊 PDF → Excel", callback_data="convert_excel")],
             [InlineKeyboardButton("📝 Только текст", callback_data="convert_text")],
+            [InlineKeyboardButton("🗂 Все форматы (Word + Excel + текст)", callback_data="convert_all")],
+            [InlineKeyboardButton("🖼 Изображения страниц", callback_data="convert_images")],
+            [InlineKeyboardButton("🗜 Сжать PDF", callback_data="convert_compress")],
+            [InlineKeyboardButton("🧾 Таблицы → CSV", callback_data="convert_csv")] + (
+                [InlineKeyboardButton("🧱 Таблицы → Parquet", callback_data="convert_parquet")]
+                if PDFConverter.parquet_available() else []
+            ),
+            [
+                InlineKeyboardButton(f"📑 Первые {pages} стр.", callback_data=f"pages:{pages}")
+                for pages in PAGE_RANGE_BUTTONS
+            ],
             [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def _images_keyboard() -> InlineKeyboardMarkup:
+        """Меню выбора формата и разрешения изображений страниц"""
+        keyboard = [
+            [
+                InlineKeyboardButton(f"{image_format.upper()} {dpi} DPI", callback_data=f"images:{image_format}:{dpi}")
+                for image_format in IMAGE_EXPORT_SETTINGS['formats']
+            ]
+            for dpi in IMAGE_EXPORT_SETTINGS['dpi_options']
+        ]
+        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def _send_preview(self, bot, message, file_info: dict):
+        """Отправляет превью первой страницы полученного PDF"""
+        preview_path = self.temp_dir / f"preview_{message.chat_id}_{message.message_id}.pdf"
+        pdf_path = await self._download_file_with_timeout(bot, file_info['file_id'], preview_path)
+        if not pdf_path:
+            return
+        try:
+            thumbnail = await asyncio.get_event_loop().run_in_executor(
+                None, self.converter.render_thumbnail, str(pdf_path), IMAGE_EXPORT_SETTINGS['preview_size']
+            )
+            if thumbnail:
+                await message.reply_photo(photo=thumbnail, caption="👀 Первая страница")
+        except Exception as e:
+            logger.error(f"Ошибка отправки превью: {e}")
+        finally:
+            if self._is_owned_file(pdf_path):
+                self.converter.cleanup_temp_files(str(pdf_path))
+    
+    @staticmethod
+    def _stop_keyboard() -> InlineKeyboardMarkup:
+        """Кнопка остановки для сообщения со статусом обработки"""
+        return InlineKeyboardMarkup([[InlineKeyboardButton("⏹ Остановить", callback_data="stop")]])
+    
+    def _cancel_token(self, job: dict) -> asyncio.Event:
+        """Регистрирует событие отмены для задачи"""
+        return self.cancel_tokens.setdefault((job['chat_id'], job['message_id']), asyncio.Event())
+    
+    def _drop_cancel_token(self, job: dict):
+        """Убирает событие отмены завершенной задачи"""
+        self.cancel_tokens.pop((job['chat_id'], job['message_id']), None)
+    
+    async def handle_stop(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопки остановки выполняющейся конвертации"""
+        query = update.callback_query
+        key = (query.message.chat_id, query.message.message_id)
         
-        await update.message.reply_text(
-            f"📁 <b>Файл получен:</b> {document.file_name}\n"
-            f"📏 <b>Размер:</b> {document.file_size // 1024} KB\n\n"
+        cancel = self.cancel_tokens.get(key)
+        if cancel:
+            cancel.set()
+            await query.answer("⏹ Останавливаю конвертацию...")
+            return
+        
+        # Задача могла уйти в очередь - ее остановит воркер
+        cancelled = await asyncio.to_thread(self.queue.cancel, *key) if self.queue else None
+        if not cancelled:
+            await query.answer("Конвертация уже завершена.")
+            return
+        
+        await query.answer("⏹ Останавливаю конвертацию...")
+        if cancelled['status'] == 'pending':
+            # Воркер задачу так и не взял - убираем файл сами
+            payload = cancelled['payload']
+            if payload.get('owns_pdf'):
+                self.converter.cleanup_temp_files(payload['pdf_path'])
+            await self._edit_status(context.bot, payload, "⏹ Конвертация остановлена.")
+    
+    async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик текстовых сообщений: диапазон страниц для загруженного файла"""
+        user_id = update.effective_user.id
+        file_info = self.sessions.get(user_id, 'current_file')
+        if not file_info:
+            return
+        
+        page_range = parse_page_range(update.message.text)
+        if not page_range:
+            await update.message.reply_text(
+                "❌ Не удалось разобрать диапазон страниц.\n"
+                "Отправьте, например, 5-12, 7 или 10- (до конца документа)."
+            )
+            return
+        
+        file_info['page_range'] = list(page_range)
+        self.sessions.set(user_id, 'current_file', file_info)
+        menu_message = await update.message.reply_text(
+            f"📁 <b>Файл:</b> {file_info['file_name']}\n"
+            f"📑 <b>Страницы:</b> {format_page_range(page_range)}\n\n"
             f"Выберите тип конвертации:",
             parse_mode=ParseMode.HTML,
-            reply_markup=reply_markup
+            reply_markup=self._conversion_keyboard()
         )
+        batch = self.sessions.get(user_id, 'batch')
+        if batch:
+            batch['menu_message_id'] = menu_message.message_id
+            self.sessions.set(user_id, 'batch', batch)
+    
+    async def _update_batch_menu(self, bot, chat_id: int, user_id: int, batch: dict):
+        """Превращает меню файла в меню пакета (не чаще раза в окно сбора)"""
+        await asyncio.sleep(BATCH_SETTINGS['menu_update_delay'])
+        batch['menu_update_pending'] = False
+        if self.sessions.get(user_id, 'batch') is batch:
+            self.sessions.set(user_id, 'batch', batch)
+        
+        keyboard = [
+            [InlineKeyboardButton("📄 Все → Word (ZIP)", callback_data="batch:convert_word")],
+            [InlineKeyboardButton("📊 Все → Excel (ZIP)", callback_data="batch:convert_excel")],
+            [InlineKeyboardButton("📝 Весь текст (ZIP)", callback_data="batch:convert_text")],
+            [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
+        ]
+        total_size = sum(file_info['file_size'] for file_info in batch['files'])
+        try:
+            await bot.edit_message_text(
+                f"📦 <b>Получено файлов:</b> {len(batch['files'])}\n"
+                f"📏 <b>Общий размер:</b> {total_size // 1024} KB\n\n"
+                f"Выберите тип конвертации для всех файлов:",
+                chat_id=chat_id,
+                message_id=batch['menu_message_id'],
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка обновления меню пакета: {e}")
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на кнопки"""
@@ -240,34 +604,92 @@ class PDFBot:
             return
         
         if query.data == "cancel":
-            context.user_data.pop('current_file', None)
+            self.sessions.clear(update.effective_user.id)
             await query.edit_message_text("❌ Операция отменена.")
             return
         
+        if query.data.startswith("batch:"):
+            await self._handle_batch_callback(update, context)
+            return
+        
+        if query.data.startswith("pages:"):
+            file_info = self.sessions.get(update.effective_user.id, 'current_file')
+            if not file_info:
+                await query.edit_message_text(
+                    "❌ Файл не найден!\n"
+                    "Пожалуйста, отправьте PDF файл сначала."
+                )
+                return
+            page_range = (0, int(query.data.split(':', 1)[1]))
+            file_info['page_range'] = list(page_range)
+            self.sessions.set(update.effective_user.id, 'current_file', file_info)
+            await query.edit_message_text(
+                f"📁 <b>Файл:</b> {file_info['file_name']}\n"
+                f"📑 <b>Страницы:</b> {format_page_range(page_range)}\n\n"
+                f"Выберите тип конвертации:",
+                parse_mode=ParseMode.HTML,
+                reply_markup=self._conversion_keyboard()
+            )
+            return
+        
         # Проверяем, есть ли файл для обработки
-        if 'current_file' not in context.user_data:
+        if self.sessions.get(update.effective_user.id, 'current_file') is None:
             await query.edit_message_text(
                 "❌ Файл не найден!\n"
                 "Пожалуйста, отправьте PDF файл сначала."
             )
             return
         
-        file_info = context.user_data['current_file']
+        if query.data == "convert_images":
+            await query.edit_message_text(
+                "🖼 Выберите формат и разрешение изображений страниц:",
+                reply_markup=self._images_keyboard()
+            )
+            return
+        
+        job_type, image_options = query.data, {}
+        if query.data.startswith("images:"):
+            _, image_format, dpi = query.data.split(':')
+            if image_format not in IMAGE_EXPORT_SETTINGS['formats'] or int(dpi) not in IMAGE_EXPORT_SETTINGS['dpi_options']:
+                return
+            job_type, image_options = "convert_images", {'image_format': image_format, 'dpi': int(dpi)}
+        
+        if not await self._check_rate_limit(query, update.effective_user.id):
+            return
+        
+        # Забираем файл сразу: конвертация идет в фоне, и повторное
+        # нажатие кнопки не должно запустить ее второй раз
+        file_info = self.sessions.pop(update.effective_user.id, 'current_file')
+        job = {
+            'type': job_type,
+            'user_id': update.effective_user.id,
+            'chat_id': query.message.chat_id,
+            'message_id': query.message.message_id,
+            'file_id': file_info['file_id'],
+            'file_name': file_info['file_name'],
+            'file_size': file_info['file_size'],
+            'page_range': file_info.get('page_range'),
+            **image_options
+        }
+        cancel = self._cancel_token(job)
+        pipeline_job = self.pipeline.track()
         
         # Показываем статус обработки
-        await query.edit_message_text("⏳ Обрабатываю файл... Пожалуйста, подождите.")
+        await query.edit_message_text(
+            "⏳ Обрабатываю файл... Пожалуйста, подождите.",
+            reply_markup=self._stop_keyboard()
+        )
         
+        pdf_path = None
         try:
             # Скачиваем файл с таймаутом
-            pdf_path = self.temp_dir / file_info['file_name']
-            
-            download_success = await self._download_file_with_timeout(
+            pdf_path = await self._download_file_with_timeout(
                 context.bot, 
                 file_info['file_id'], 
-                pdf_path
+                self._job_path(job, file_info['file_name'])
             )
             
-            if not download_success:
+            if not pdf_path:
                 await query.edit_message_text(
                     "❌ Ошибка при скачивании файла!\n"
                     "Возможно, файл слишком большой или произошла ошибка сети.\n"
@@ -278,16 +700,38 @@ class PDFBot:
             # Валидируем PDF
             if not self.converter.validate_pdf(str(pdf_path)):
                 await query.edit_message_text("❌ Файл поврежден или не является валидным PDF!")
-                self.converter.cleanup_temp_files(str(pdf_path))
                 return
             
-            # Выполняем конвертацию в зависимости от выбора с таймаутом
-            if query.data == "convert_word":
-                await self._convert_to_word_async(update, context, pdf_path, file_info)
-            elif query.data == "convert_excel":
-                await self._convert_to_excel_async(update, context, pdf_path, file_info)
-            elif query.data == "convert_text":
-                await self._extract_text_only_async(update, context, pdf_path, file_info)
+            job['pdf_path'] = str(pdf_path)
+            job['owns_pdf'] = self._is_owned_file(pdf_path)
+            
+            # Оцениваем стоимость и отклоняем заведомо неподъемные задачи
+            if not await self._preflight(context.bot, job):
+                return
+            
+            if cancel.is_set():
+                await self._edit_status(context.bot, job, "⏹ Конвертация остановлена.")
+                return
+            
+            # Списываем оценочную стоимость задачи с квоты пользователя
+            if not await self._consume_rate_limit(context.bot, job):
+                return
+            
+            if self.queue:
+                # Конвертацию выполнит отдельный воркер, он же удалит файл
+                self.queue.enqueue(job)
+                # Трассу запишет и папку задачи удалит воркер, выполнивший задачу
+                job['enqueued'] = True
+                pdf_path = None
+                eta = f"\n⏱ Ожидаемое время конвертации: ~{format_duration(job['estimate'])}" if 'estimate' in job else ""
+                await query.edit_message_text(
+                    "📥 Файл поставлен в очередь на конвертацию.\n"
+                    f"Результат придет в этот чат.{eta}",
+                    reply_markup=self._stop_keyboard()
+                )
+                return
+            
+            await self.process_job(context.bot, job)
             
         except Exception as e:
             logger.error(f"Ошибка обработки файла: {e}")
@@ -296,292 +740,1059 @@ class PDFBot:
                 "Попробуйте еще раз или обратитесь к администратору."
             )
         finally:
-            # Очищаем временные файлы
-            if 'pdf_path' in locals():
+            # Очищаем временные файлы (файлы локального Bot API сервера не трогаем)
+            if pdf_path and self._is_owned_file(pdf_path):
                 self.converter.cleanup_temp_files(str(pdf_path))
-            context.user_data.pop('current_file', None)
+            self._drop_cancel_token(job)
+            self._finish_job(job, pipeline_job)
     
-    async def _convert_to_word_async(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                                    pdf_path: Path, file_info: dict):
-        """Конвертирует PDF в Word с таймаутом"""
+    async def _handle_batch_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запускает пакетную конвертацию всех собранных файлов"""
         query = update.callback_query
+        batch = self.sessions.get(update.effective_user.id, 'batch')
+        if not batch or batch['menu_message_id'] != query.message.message_id:
+            await query.edit_message_text(
+                "❌ Файлы не найдены!\n"
+                "Пожалуйста, отправьте PDF файлы заново."
+            )
+            return
+        
+        # Только пакет: файл или новый пакет, присланные во время обработки, остаются
+        self.sessions.pop(update.effective_user.id, 'batch')
+        
+        if not await self._check_rate_limit(query, update.effective_user.id):
+            return
+        
+        job = {
+            'type': query.data.split(':', 1)[1],
+            'user_id': update.effective_user.id,
+            'chat_id': query.message.chat_id,
+            'message_id': query.message.message_id
+        }
+        try:
+            await self._process_batch(context.bot, job, batch['files'])
+        except Exception as e:
+            logger.error(f"Ошибка пакетной обработки: {e}")
+            await self._edit_status(
+                context.bot, job,
+                "❌ Произошла ошибка при обработке файлов!\n"
+                "Попробуйте еще раз или обратитесь к администратору."
+            )
+    
+    async def _process_batch(self, bot, batch_job: dict, files: list):
+        """Параллельно конвертирует пакет файлов и отправляет результат ZIP-архивами.
+
+        Готовые файлы сразу дописываются в архив; когда архив достигает
+        предельного размера, он отправляется и начинается следующий.
+        """
+        batch_dir = self.temp_dir / f"batch_{batch_job['chat_id']}_{batch_job['message_id']}"
+        batch_dir.mkdir(exist_ok=True)
+        statuses = ["⏳"] * len(files)
+        progress = {'last_edit': 0.0}
+        
+        async def show_progress(final: bool = False, force: bool = False):
+            # Одно сообщение со статусом каждого файла, не чаще раза в несколько секунд
+            now = time.monotonic()
+            if not (final or force) and now - progress['last_edit'] < BATCH_SETTINGS['progress_interval']:
+                return
+            progress['last_edit'] = now
+            done = sum(1 for status in statuses if not status.startswith("⏳"))
+            lines = [f"{status} {file_info['file_name']}" for status, file_info in zip(statuses, files)]
+            header = "✅ <b>Пакет обработан</b>" if final else "⏳ <b>Обрабатываю файлы...</b>"
+            await self._edit_status(
+                bot, batch_job,
+                f"{header} ({done}/{len(files)})\n\n" + "\n".join(lines)
+            )
+        
+        async def convert_one(index: int, file_info: dict):
+            job = dict(batch_job, **file_info)
+            pipeline_job = self.pipeline.track()
+            pdf_path = await self._download_file_with_timeout(
+                bot, file_info['file_id'], batch_dir / f"{index}_{file_info['file_name']}"
+            )
+            try:
+                if not pdf_path:
+                    return index, None, "ошибка скачивания"
+                if not self.converter.validate_pdf(str(pdf_path)):
+                    return index, None, "файл поврежден"
+                job['pdf_path'] = str(pdf_path)
+                if not await self._analyze(job):
+                    return index, None, "скан без текста" if job.get('rejection') == 'scanned' else "слишком большой"
+                if self.rate_limiter and not self.rate_limiter.try_consume(
+                        job['user_id'], job.get('estimate', RATE_LIMIT_SETTINGS['default_cost'])):
+                    return index, None, "лимит обработки исчерпан"
+                # Свой каталог на файл: одноименные файлы пакета не пересекаются
+                output_dir = batch_dir / str(index)
+                output_dir.mkdir(exist_ok=True)
+                output_path = await self._produce_output(job, pdf_path, output_dir)
+                if not output_path:
+                    return index, None, "ошибка конвертации"
+                return index, output_path, None
+            except asyncio.TimeoutError:
+                return index, None, "превышено время"
+            except MemoryLimitExceeded:
+                return index, None, "превышен лимит памяти"
+            finally:
+                self._finish_job(job, pipeline_job)
+                if pdf_path and self._is_owned_file(pdf_path):
+                    self.converter.cleanup_temp_files(str(pdf_path))
+        
+        await show_progress(force=True)
+        archive = None
+        archive_path = None
+        archive_names = set()
+        parts_sent = 0
+        part_limit = BATCH_SETTINGS['zip_part_size']
+        
+        async def send_archive():
+            nonlocal archive, parts_sent
+            archive.close()
+            archive = None
+            parts_sent += 1
+            await self._send_file_with_timeout(
+                bot, batch_job['chat_id'], archive_path, archive_path.name,
+                f"📦 <b>Результаты конвертации</b> (часть {parts_sent})"
+            )
+            self.converter.cleanup_temp_files(str(archive_path))
+        
+        try:
+            tasks = [asyncio.ensure_future(convert_one(i, f)) for i, f in enumerate(files)]
+            for finished in asyncio.as_completed(tasks):
+                index, output_path, error = await finished
+                if error:
+                    statuses[index] = f"❌ ({error})"
+                    await show_progress()
+                    continue
+                
+                output_size = output_path.stat().st_size
+                if archive and archive_path.stat().st_size + output_size > part_limit:
+                    await send_archive()
+                if archive is None:
+                    archive_path = batch_dir / f"converted_part{parts_sent + 1}.zip"
+                    archive = zipfile.ZipFile(archive_path, 'w')
+                
+                # DOCX/XLSX уже сжаты - сохраняем без повторного сжатия
+                name = output_path.name
+                while name in archive_names:
+                    name = f"{output_path.stem}_{len(archive_names)}{output_path.suffix}"
+                archive_names.add(name)
+                compression = zipfile.ZIP_DEFLATED if output_path.suffix == '.txt' else zipfile.ZIP_STORED
+                await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: archive.write(output_path, name, compress_type=compression)
+                )
+                self.converter.cleanup_temp_files(str(output_path))
+                statuses[index] = "✅"
+                await show_progress()
+            
+            if archive:
+                await send_archive()
+            await show_progress(final=True)
+            if not parts_sent:
+                await self._edit_status(bot, batch_job, "❌ Не удалось конвертировать ни один файл!\n\n" +
+                                        "\n".join(f"{status} {f['file_name']}" for status, f in zip(statuses, files)))
+        finally:
+            if archive:
+                archive.close()
+            shutil.rmtree(batch_dir, ignore_errors=True)
+    
+    async def process_job(self, bot, job: dict):
+        """Выполняет конвертацию скачанного PDF и отправляет результат в чат.
+
+        Используется как самим ботом, так и воркерами очереди (worker.py).
+        """
+        pdf_path = Path(job['pdf_path'])
+        
+        try:
+            # Выполняем конвертацию в зависимости от выбора с таймаутом
+            if job['type'] == "convert_word":
+                await self._convert_to_word_async(bot, job, pdf_path)
+            elif job['type'] == "convert_excel":
+                await self._convert_to_excel_async(bot, job, pdf_path)
+            elif job['type'] == "convert_text":
+                await self._extract_text_only_async(bot, job, pdf_path)
+            elif job['type'] == "convert_all":
+                await self._convert_all_async(bot, job, pdf_path)
+            elif job['type'] == "convert_images":
+                await self._convert_to_images_async(bot, job, pdf_path)
+            elif job['type'] in ("convert_csv", "convert_parquet"):
+                await self._export_tables_async(bot, job, pdf_path)
+            elif job['type'] == "convert_compress":
+                await self._compress_pdf_async(bot, job, pdf_path)
+        finally:
+            self._stop_progress(job)
+    
+    async def _analyze(self, job: dict) -> bool:
+        """Анализирует PDF и подбирает таймаут по модели стоимости.
+
+        Возвращает False, если задача заведомо не уложится в лимиты
+        или не может дать результата (текст из сканов без OCR).
+        """
+        info = await asyncio.get_event_loop().run_in_executor(
+            None, self.converter.get_preflight_info, job['pdf_path'], *(job.get('page_range') or ())
+        )
+        if not info:
+            return True
+        
+        if job.get('page_range'):
+            start, end = job['page_range']
+            if start >= info['total_pages']:
+                job['rejection'] = 'page_range'
+                job['preflight'] = info
+                return False
+            job['page_range'] = [start, min(end or info['total_pages'], info['total_pages'])]
+        
+        tables_only = job['type'] in ('convert_csv', 'convert_parquet')
+        if (info['pages'] and info.get('image_pages') == info['pages'] and (tables_only or (
+                job['type'] in ('convert_text', 'convert_excel') and not self.converter.ocr_available()))):
+            # Одни сканы: таблиц не будет, а без OCR и текста - не заставляем ждать
+            job['rejection'] = 'scanned'
+            job['preflight'] = info
+            return False
+        
+        estimate = self.cost_model.predict(job['type'], info)
+        job['preflight'] = info
+        job['estimate'] = estimate
+        if self.cost_model.exceeds_limits(estimate):
+            job['rejection'] = 'too_large'
+            return False
+        job['timeout'] = self.cost_model.timeout_for(estimate)
+        return True
+    
+    async def _preflight(self, bot, job: dict) -> bool:
+        """Анализирует PDF, подбирает таймаут и сообщает ожидаемое время.
+
+        Возвращает False, если задача отклонена.
+        """
+        if not await self._analyze(job):
+            if job['rejection'] == 'page_range':
+                await self._edit_status(
+                    bot, job,
+                    f"❌ В документе всего {job['preflight']['total_pages']} стр.!\n"
+                    "Отправьте файл еще раз и укажите другой диапазон."
+                )
+                return False
+            
+            if job['rejection'] == 'scanned':
+                await self._edit_status(
+                    bot, job,
+                    "📷 <b>Похоже, это скан!</b>\n\n"
+                    "В документе нет текстового слоя, поэтому текст и таблицы извлечь нельзя.\n"
+                    "Конвертация в Word вставит страницы изображениями."
+                )
+                return False
+            
+            info, estimate = job['preflight'], job['estimate']
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Файл слишком большой для обработки!</b>\n\n"
+                f"Страниц: {info['pages']}, ожидаемое время: ~{format_duration(estimate)}.\n"
+                "Попробуйте отправить файл меньшего размера."
+            )
+            logger.info(f"Задача {job['type']} отклонена: прогноз {estimate:.0f} сек")
+            return False
+        
+        if 'preflight' in job:
+            pages = f"{job['preflight']['pages']}"
+            if job.get('page_range'):
+                pages += f" ({format_page_range(job['page_range'])} из {job['preflight']['total_pages']})"
+            await self._edit_status(
+                bot, job,
+                "⏳ Обрабатываю файл... Пожалуйста, подождите.\n"
+                f"📄 Страниц: {pages}\n"
+                f"⏱ Ожидаемое время: ~{format_duration(job['estimate'])}",
+                final=False
+            )
+        return True
+    
+    @staticmethod
+    def _page_kwargs(job: dict) -> dict:
+        """Диапазон страниц задачи в виде аргументов методов PDFConverter"""
+        if not job.get('page_range'):
+            return {}
+        start, end = job['page_range']
+        return {'start': start, 'end': end}
+    
+    async def _produce_output(self, job: dict, pdf_path: Path, output_dir: Path) -> Optional[Path]:
+        """Конвертирует PDF в файл выбранного формата без отправки"""
+        stem = Path(job['file_name']).stem
+        if job['type'] == "convert_word":
+            output_path = output_dir / f"{stem}.docx"
+            success = await self._run_converter(
+                job, 'convert_to_word', str(pdf_path), str(output_path), True, True,
+                **self._page_kwargs(job)
+            )
+        elif job['type'] == "convert_excel":
+            output_path = output_dir / f"{stem}.xlsx"
+            success = await self._run_converter(
+                job, 'extract_tables_to_excel', str(pdf_path), str(output_path),
+                **self._page_kwargs(job)
+            )
+        elif job['type'] == "convert_text":
+            output_path = output_dir / f"{stem}.txt"
+            text = await self._run_converter(
+                job, 'extract_text_only', str(pdf_path), **self._page_kwargs(job)
+            )
+            success = bool(text)
+            if success:
+                with open(output_path, 'w', encoding='utf-8') as txt_file:
+                    txt_file.write(text)
+        else:
+            return None
+        
+        if success and output_path.exists():
+            return output_path
+        self.converter.cleanup_temp_files(str(output_path))
+        return None
+    
+    async def _check_rate_limit(self, target, user_id: int) -> bool:
+        """Отказывает пользователю, полностью исчерпавшему квоту"""
+        if not self.rate_limiter or self.rate_limiter.has_budget(user_id):
+            return True
         
+        wait = self.rate_limiter.retry_after(user_id, RATE_LIMIT_SETTINGS['default_cost'])
+        text = (
+            "⏳ <b>Лимит обработки исчерпан!</b>\n\n"
+            f"Попробуйте снова через ~{format_duration(wait)}."
+        )
+        if hasattr(target, 'edit_message_text'):
+            await target.edit_message_text(text, parse_mode=ParseMode.HTML)
+        else:
+            await target.reply_text(text, parse_mode=ParseMode.HTML)
+        return False
+    
+    async def _consume_rate_limit(self, bot, job: dict) -> bool:
+        """Списывает оценочную стоимость задачи (CPU-секунды) с квоты пользователя"""
+        if not self.rate_limiter:
+            return True
+        
+        cost = job.get('estimate', RATE_LIMIT_SETTINGS['default_cost'])
+        if self.rate_limiter.try_consume(job['user_id'], cost):
+            return True
+        
+        wait = self.rate_limiter.retry_after(job['user_id'], cost)
+        await self._edit_status(
+            bot, job,
+            "⏳ <b>Лимит обработки исчерпан!</b>\n\n"
+            f"Этот файл требует ~{format_duration(cost)} обработки.\n"
+            f"Попробуйте снова через ~{format_duration(wait)} или отправьте файл поменьше."
+        )
+        logger.info(f"Пользователь {job['user_id']} превысил квоту: стоимость {cost:.0f} сек")
+        return False
+    
+    async def _run_converter(self, job: dict, method: str, *args, calibrate: bool = True,
+                             timeout: Optional[float] = None, **kwargs):
+        """Выполняет метод конвертера в пуле и калибрует модель стоимости"""
+        async with self.pipeline.convert.slot():
+            started = time.monotonic()
+            try:
+                result = await self.pool.run(
+                    method, *args,
+                    timeout=timeout or job.get('timeout', TIMEOUT_SETTINGS['conversion']),
+                    cancel=self.cancel_tokens.get((job['chat_id'], job['message_id'])),
+                    stats=job.setdefault('worker_stats', {}),
+                    **kwargs
+                )
+            except asyncio.TimeoutError:
+                job.setdefault('outcome', 'timeout')
+                raise
+            except MemoryLimitExceeded:
+                job.setdefault('outcome', 'memory')
+                raise
+            except ConversionCancelled:
+                job.setdefault('outcome', 'cancelled')
+                raise
+            except Exception:
+                job.setdefault('outcome', 'error')
+                raise
+            elapsed = time.monotonic() - started
+        if calibrate and result and job.get('preflight'):
+            self.cost_model.record(job['type'], job['preflight'], elapsed)
+        if not self.first_conversion_logged:
+            self.first_conversion_logged = True
+            logger.info(f"Первая конвертация ({method}) выполнена за {elapsed:.2f} сек")
+        return result
+    
+    @staticmethod
+    def _retry_in_queue(job: dict, error: Exception) -> bool:
+        """Ошибку повторит воркер очереди: упавший процесс конвертации или таймаут.
+
+        Воркер помечает задачу retriable, пока у нее остаются попытки; такие
+        ошибки пробрасываются из обработчиков в цикл воркера вместо ответа
+        пользователю.
+        """
+        return bool(job.get('retriable')) and isinstance(error, (WorkerError, asyncio.TimeoutError))
+    
+    def _finish_job(self, job: dict, pipeline_job: PipelineJob):
+        """Освобождает место задачи в конвейере, удаляет ее результаты и записывает трассу"""
+        pipeline_job.close()
+        if not job.get('enqueued'):
+            # Папку задачи из очереди удаляет воркер: он мог уже начать в нее писать
+            shutil.rmtree(self._job_dir(job), ignore_errors=True)
+        if self.tracer and not job.get('enqueued'):
+            self.tracer.record(job, pipeline_job.waits, pipeline_job.busy)
+    
+    def _start_progress(self, bot, job: dict, title: str) -> ProgressReporter:
+        """Создает отображение прогресса для сообщения со статусом задачи"""
+        reporter = ProgressReporter(
+            lambda text: self._edit_status(bot, job, text, final=False),
+            self.edit_throttle,
+            job['chat_id'],
+            title
+        )
+        self.progress_reporters[(job['chat_id'], job['message_id'])] = reporter
+        return reporter
+    
+    def _stop_progress(self, job: dict):
+        """Останавливает отображение прогресса задачи"""
+        reporter = self.progress_reporters.pop((job['chat_id'], job['message_id']), None)
+        if reporter:
+            reporter.close()
+    
+    async def _edit_status(self, bot, job: dict, text: str, final: bool = True):
+        """Обновляет сообщение со статусом обработки.
+
+        Итоговый статус (final) отменяет отложенные правки прогресса,
+        чтобы они не перезаписали результат. Промежуточные статусы
+        выполняющейся задачи показываются с кнопкой остановки.
+        """
+        if final:
+            self._stop_progress(job)
+        stoppable = not final and (job['chat_id'], job['message_id']) in self.cancel_tokens
+        self.edit_throttle.mark(job['chat_id'])
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=job['chat_id'],
+                message_id=job['message_id'],
+                parse_mode=ParseMode.HTML,
+                reply_markup=self._stop_keyboard() if stoppable else None
+            )
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса: {e}")
+    
+    async def _convert_to_word_async(self, bot, job: dict, pdf_path: Path):
+        """Конвертирует PDF в Word с таймаутом"""
         # Создаем имя выходного файла
-        output_name = file_info['file_name'].replace('.pdf', '.docx')
-        output_path = self.temp_dir / output_name
+        output_name = job['file_name'].replace('.pdf', '.docx')
+        output_path = self._output_path(job, output_name)
         
         try:
             # Выполняем конвертацию с таймаутом
-            success = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.converter.convert_to_word,
-                    str(pdf_path),
-                    str(output_path),
-                    True,  # preserve_layout
-                    True   # include_images
-                ),
-                timeout=TIMEOUT_SETTINGS['conversion']
+            reporter = self._start_progress(bot, job, "Конвертирую в Word...")
+            success = await self._run_converter(
+                job,
+                'convert_to_word',
+                str(pdf_path),
+                str(output_path),
+                True,  # preserve_layout
+                True,  # include_images
+                progress=reporter.callback(),
+                **self._page_kwargs(job)
             )
             
             if success and output_path.exists():
                 # Отправляем результат с таймаутом
                 send_success = await self._send_file_with_timeout(
-                    context.bot,
-                    query.message.chat_id,
+                    bot,
+                    job['chat_id'],
                     output_path,
                     output_name,
                     f"✅ <b>Конвертация завершена!</b>\n"
-                    f"📄 {file_info['file_name']} → {output_name}"
+                    f"📄 {job['file_name']} → {output_name}"
                 )
                 
                 if send_success:
-                    await query.edit_message_text("✅ Файл успешно конвертирован в Word!")
+                    await self._edit_status(bot, job, "✅ Файл успешно конвертирован в Word!")
                 else:
-                    await query.edit_message_text(
+                    await self._edit_status(
+                        bot, job,
                         "❌ Ошибка при отправке файла!\n"
                         "Конвертация прошла успешно, но не удалось отправить результат."
                     )
                 
                 self.converter.cleanup_temp_files(str(output_path))
             else:
-                await query.edit_message_text("❌ Ошибка конвертации в Word!")
+                await self._edit_status(bot, job, "❌ Ошибка конвертации в Word!")
                 
-        except asyncio.TimeoutError:
-            await query.edit_message_text(
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
                 "⏰ <b>Превышено время конвертации!</b>\n\n"
                 "Файл слишком большой или сложный для обработки.\n"
                 "Попробуйте отправить файл меньшего размера."
             )
-            logger.error(f"Таймаут конвертации Word для файла {file_info['file_name']}")
+            logger.error(f"Таймаут конвертации Word для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            self.converter.cleanup_temp_files(str(output_path))
+            logger.info(f"Конвертация Word для файла {job['file_name']} остановлена пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            self.converter.cleanup_temp_files(str(output_path))
+            logger.error(f"Превышен лимит памяти при конвертации Word для файла {job['file_name']}")
         except Exception as e:
-            await query.edit_message_text("❌ Ошибка конвертации в Word!")
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка конвертации в Word!")
             logger.error(f"Ошибка конвертации Word: {e}")
     
-    async def _convert_to_word(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                              pdf_path: Path, file_info: dict):
-        """Конвертирует PDF в Word"""
-        query = update.callback_query
-        
-        # Создаем имя выходного файла
-        output_name = file_info['file_name'].replace('.pdf', '.docx')
-        output_path = self.temp_dir / output_name
-        
-        # Выполняем конвертацию
-        success = self.converter.convert_to_word(
-            str(pdf_path), 
-            str(output_path),
-            preserve_layout=True,
-            include_images=True
-        )
-        
-        if success and output_path.exists():
-            # Отправляем результат с таймаутом
-            send_success = await self._send_file_with_timeout(
-                context.bot,
-                query.message.chat_id,
-                output_path,
-                output_name,
-                f"✅ <b>Конвертация завершена!</b>\n"
-                f"📄 {file_info['file_name']} → {output_name}"
-            )
-            
-            if send_success:
-                await query.edit_message_text("✅ Файл успешно конвертирован в Word!")
-            else:
-                await query.edit_message_text(
-                    "❌ Ошибка при отправке файла!\n"
-                    "Конвертация прошла успешно, но не удалось отправить результат."
-                )
-            
-            self.converter.cleanup_temp_files(str(output_path))
-        else:
-            await query.edit_message_text("❌ Ошибка конвертации в Word!")
-    
-    async def _convert_to_excel_async(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                                     pdf_path: Path, file_info: dict):
+    async def _convert_to_excel_async(self, bot, job: dict, pdf_path: Path):
         """Конвертирует PDF в Excel с таймаутом"""
-        query = update.callback_query
-        
         # Создаем имя выходного файла
-        output_name = file_info['file_name'].replace('.pdf', '.xlsx')
-        output_path = self.temp_dir / output_name
+        output_name = job['file_name'].replace('.pdf', '.xlsx')
+        output_path = self._output_path(job, output_name)
         
         try:
             # Выполняем конвертацию с таймаутом
-            success = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.converter.extract_tables_to_excel,
-                    str(pdf_path),
-                    str(output_path)
-                ),
-                timeout=TIMEOUT_SETTINGS['conversion']
+            reporter = self._start_progress(bot, job, "Извлекаю таблицы...")
+            success = await self._run_converter(
+                job,
+                'extract_tables_to_excel',
+                str(pdf_path),
+                str(output_path),
+                progress=reporter.callback(),
+                **self._page_kwargs(job)
             )
             
             if success and output_path.exists():
                 # Отправляем результат с таймаутом
                 send_success = await self._send_file_with_timeout(
-                    context.bot,
-                    query.message.chat_id,
+                    bot,
+                    job['chat_id'],
                     output_path,
                     output_name,
                     f"✅ <b>Конвертация завершена!</b>\n"
-                    f"📊 {file_info['file_name']} → {output_name}"
+                    f"📊 {job['file_name']} → {output_name}"
                 )
                 
                 if send_success:
-                    await query.edit_message_text("✅ Файл успешно конвертирован в Excel!")
+                    await self._edit_status(bot, job, "✅ Файл успешно конвертирован в Excel!")
                 else:
-                    await query.edit_message_text(
+                    await self._edit_status(
+                        bot, job,
                         "❌ Ошибка при отправке файла!\n"
                         "Конвертация прошла успешно, но не удалось отправить результат."
                     )
                 
                 self.converter.cleanup_temp_files(str(output_path))
             else:
-                await query.edit_message_text("❌ Ошибка конвертации в Excel!")
+                await self._edit_status(bot, job, "❌ Ошибка конвертации в Excel!")
                 
-        except asyncio.TimeoutError:
-            await query.edit_message_text(
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
                 "⏰ <b>Превышено время конвертации!</b>\n\n"
                 "Файл слишком большой или сложный для обработки.\n"
                 "Попробуйте отправить файл меньшего размера."
             )
-            logger.error(f"Таймаут конвертации Excel для файла {file_info['file_name']}")
+            logger.error(f"Таймаут конвертации Excel для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            self.converter.cleanup_temp_files(str(output_path))
+            logger.info(f"Конвертация Excel для файла {job['file_name']} остановлена пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            self.converter.cleanup_temp_files(str(output_path))
+            logger.error(f"Превышен лимит памяти при конвертации Excel для файла {job['file_name']}")
         except Exception as e:
-            await query.edit_message_text("❌ Ошибка конвертации в Excel!")
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка конвертации в Excel!")
             logger.error(f"Ошибка конвертации Excel: {e}")
     
-    async def _convert_to_excel(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                               pdf_path: Path, file_info: dict):
-        """Конвертирует PDF в Excel"""
-        query = update.callback_query
+    def _text_chunks(self, job: dict) -> List[Tuple[int, int]]:
+        """Разбивает страницы задачи на порции для постепенной выдачи текста.
+
+        Первая порция маленькая, чтобы начало текста пришло быстро,
+        следующие растут вдвое до max_chunk_pages.
+        """
+        info = job.get('preflight') or {}
+        start, end = job.get('page_range') or (0, info.get('total_pages'))
+        if end is None or end - start <= TEXT_DELIVERY_SETTINGS['single_chunk_pages']:
+            return [(start, end)]
         
-        # Создаем имя выходного файла
-        output_name = file_info['file_name'].replace('.pdf', '.xlsx')
-        output_path = self.temp_dir / output_name
+        chunks = []
+        size = TEXT_DELIVERY_SETTINGS['first_chunk_pages']
+        while start < end:
+            chunks.append((start, min(start + size, end)))
+            start += size
+            size = min(size * 2, TEXT_DELIVERY_SETTINGS['max_chunk_pages'])
+        return chunks
+    
+    async def _send_text_with_timeout(self, bot, chat_id: int, text: str) -> bool:
+        """Отправляет текст сообщением с таймаутом"""
+        async with self.pipeline.upload.slot():
+            try:
+                await asyncio.wait_for(
+                    bot.send_message(chat_id=chat_id, text=text),
+                    timeout=TIMEOUT_SETTINGS['telegram_request']
+                )
+                return True
+            except asyncio.TimeoutError:
+                logger.error(f"Таймаут при отправке сообщения в чат {chat_id}")
+                return False
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения: {e}")
+                return False
+    
+    async def _extract_text_only_async(self, bot, job: dict, pdf_path: Path):
+        """Извлекает текст из PDF порциями и отправляет каждую порцию сразу.
+
+        Короткий текст приходит сообщениями без загрузки файла, длинный -
+        частями .txt по мере извлечения страниц.
+        """
+        chunks = self._text_chunks(job)
+        stem = Path(job['file_name']).stem
+        total_pages = chunks[-1][1]
+        deadline = time.monotonic() + job.get('timeout', TIMEOUT_SETTINGS['conversion'])
+        started = time.monotonic()
+        inline_messages = 0
+        anything_sent = False
+        reporter = self._start_progress(bot, job, "Извлекаю текст...")
+        
+        try:
+            for chunk_start, chunk_end in chunks:
+                # Прогресс порции пересчитываем в прогресс всего диапазона
+                def progress(done, total, offset=chunk_start - chunks[0][0]):
+                    whole = total_pages - chunks[0][0] if total_pages else total
+                    reporter.update('', offset + done, whole)
+                
+                # Извлекаем порцию с таймаутом (общим на всю задачу)
+                text = await self._run_converter(
+                    job,
+                    'extract_text_only',
+                    str(pdf_path),
+                    start=chunk_start,
+                    end=chunk_end,
+                    calibrate=False,
+                    timeout=max(1.0, deadline - time.monotonic()),
+                    progress=progress
+                )
+                
+                if text:
+                    pages_label = format_page_range((chunk_start, chunk_end)) if chunk_end else "все"
+                    if (len(text) <= TEXT_DELIVERY_SETTINGS['inline_limit'] and
+                            inline_messages < TEXT_DELIVERY_SETTINGS['max_inline_messages']):
+                        # Короткую порцию отправляем сообщением, без файла
+                        header = f"📝 Стр. {pages_label}\n\n" if len(chunks) > 1 else ""
+                        sent = await self._send_text_with_timeout(bot, job['chat_id'], header + text)
+                        inline_messages += 1
+                    else:
+                        suffix = f"_p{chunk_start + 1}-{chunk_end}" if len(chunks) > 1 else ""
+                        output_name = f"{stem}{suffix}.txt"
+                        output_path = self._output_path(job, output_name)
+                        with open(output_path, 'w', encoding='utf-8') as txt_file:
+                            txt_file.write(text)
+                        try:
+                            sent = await self._send_file_with_timeout(
+                                bot,
+                                job['chat_id'],
+                                output_path,
+                                output_name,
+                                f"✅ <b>Текст извлечен!</b>\n"
+                                f"📝 {job['file_name']} → {output_name}"
+                            )
+                        finally:
+                            self.converter.cleanup_temp_files(str(output_path))
+                    
+                    if not sent:
+                        await self._edit_status(
+                            bot, job,
+                            "❌ Ошибка при отправке результата!\n"
+                            "Текст извлечен успешно, но не удалось отправить результат."
+                        )
+                        return
+                    anything_sent = True
+                    # Повтор задачи воркером продублировал бы отправленный текст
+                    job['retriable'] = False
+            
+            if anything_sent:
+                if job.get('preflight'):
+                    self.cost_model.record(job['type'], job['preflight'], time.monotonic() - started)
+                await self._edit_status(bot, job, "✅ Текст успешно извлечен!")
+            else:
+                await self._edit_status(bot, job, "❌ Не удалось извлечь текст из файла!")
+                
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Превышено время обработки!</b>\n\n"
+                "Файл слишком большой или сложный для обработки.\n"
+                "Попробуйте отправить файл меньшего размера."
+            )
+            logger.error(f"Таймаут извлечения текста для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Извлечение текста остановлено.")
+            logger.info(f"Извлечение текста из файла {job['file_name']} остановлено пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            logger.error(f"Превышен лимит памяти при извлечении текста из файла {job['file_name']}")
+        except Exception as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Не удалось извлечь текст из файла!")
+            logger.error(f"Ошибка извлечения текста: {e}")
+    
+    async def post_init(self, application: Application):
+        """Запускает прогрев воркеров в фоне, пока бот начинает опрос"""
+        if not self.queue:
+            # С очередью конвертацию выполняют процессы worker.py
+            self.pool.start()
+        logger.info(f"Бот готов к опросу через {time.monotonic() - PROCESS_STARTED:.2f} сек после запуска")
+    
+    async def track_first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Фиксирует время до первого полученного обновления"""
+        if not self.first_update_logged:
+            self.first_update_logged = True
+            logger.info(f"Первое обновление получено через {time.monotonic() - PROCESS_STARTED:.2f} сек после запуска")
+    
+    async def _convert_all_async(self, bot, job: dict, pdf_path: Path):
+        """Конвертирует PDF сразу в Word, Excel и текст.
+
+        Текст и таблицы извлекаются за один проход pdfplumber, параллельно
+        с ним в другом воркере работает pdf2docx. Страницы-сканы оба
+        прохода берут из предварительного анализа, а не определяют заново.
+        Результаты отправляются одним альбомом.
+        """
+        stem = Path(job['file_name']).stem
+        outputs = [
+            (self._output_path(job, f"{stem}.docx"), f"{stem}.docx"),
+            (self._output_path(job, f"{stem}.xlsx"), f"{stem}.xlsx"),
+            (self._output_path(job, f"{stem}.txt"), f"{stem}.txt")
+        ]
+        (word_path, _), (excel_path, _), (text_path, _) = outputs
         
-        # Выполняем конвертацию
-        success = self.converter.extract_tables_to_excel(str(pdf_path), str(output_path))
+        # Без предварительного анализа каждый проход классифицирует страницы сам
+        scan_page_numbers = (job.get('preflight') or {}).get('scan_page_numbers')
         
-        if success and output_path.exists():
-            # Отправляем результат с таймаутом
-            send_success = await self._send_file_with_timeout(
-                context.bot,
-                query.message.chat_id,
-                output_path,
-                output_name,
+        try:
+            started = time.monotonic()
+            reporter = self._start_progress(bot, job, "Конвертирую во все форматы...")
+            word_success, extract_success = await asyncio.gather(
+                self._run_converter(
+                    job, 'convert_to_word', str(pdf_path), str(word_path), True, True,
+                    calibrate=False, progress=reporter.callback("Word"),
+                    scan_page_numbers=scan_page_numbers, **self._page_kwargs(job)
+                ),
+                self._run_converter(
+                    job, 'extract_text_and_tables', str(pdf_path), str(text_path), str(excel_path),
+                    calibrate=False, progress=reporter.callback("Текст и таблицы"),
+                    scan_page_numbers=scan_page_numbers, **self._page_kwargs(job)
+                )
+            )
+            if word_success and extract_success and job.get('preflight'):
+                self.cost_model.record(job['type'], job['preflight'], time.monotonic() - started)
+            
+            # Отправляем только успешно созданные непустые файлы
+            ready = [(path, name) for path, name in outputs if path.exists() and path.stat().st_size > 0]
+            if not ready:
+                await self._edit_status(bot, job, "❌ Ошибка конвертации!")
+                return
+            
+            send_success = await self._send_files_with_timeout(
+                bot,
+                job['chat_id'],
+                ready,
                 f"✅ <b>Конвертация завершена!</b>\n"
-                f"📊 {file_info['file_name']} → {output_name}"
+                f"🗂 {job['file_name']} → {', '.join(name for _, name in ready)}"
             )
             
-            if send_success:
-                await query.edit_message_text("✅ Файл успешно конвертирован в Excel!")
-            else:
-                await query.edit_message_text(
-                    "❌ Ошибка при отправке файла!\n"
+            if not send_success:
+                await self._edit_status(
+                    bot, job,
+                    "❌ Ошибка при отправке файлов!\n"
                     "Конвертация прошла успешно, но не удалось отправить результат."
                 )
+            elif len(ready) < len(outputs):
+                await self._edit_status(bot, job, "⚠️ Часть форматов получить не удалось, остальные отправлены.")
+            else:
+                await self._edit_status(bot, job, "✅ Файл успешно конвертирован во все форматы!")
+                
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Превышено время конвертации!</b>\n\n"
+                "Файл слишком большой или сложный для обработки.\n"
+                "Попробуйте отправить файл меньшего размера."
+            )
+            logger.error(f"Таймаут конвертации во все форматы для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            logger.info(f"Конвертация во все форматы для файла {job['file_name']} остановлена пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            logger.error(f"Превышен лимит памяти при конвертации во все форматы для файла {job['file_name']}")
+        except Exception as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка конвертации!")
+            logger.error(f"Ошибка конвертации во все форматы: {e}")
+        finally:
+            self.converter.cleanup_temp_files(*(str(path) for path, _ in outputs))
+    
+    async def _export_tables_async(self, bot, job: dict, pdf_path: Path):
+        """Экспортирует таблицы в ZIP с CSV или в Parquet, минуя Excel"""
+        suffix, method, label = {
+            'convert_csv': ('_tables.zip', 'extract_tables_to_csv_zip', 'CSV'),
+            'convert_parquet': ('_tables.parquet', 'extract_tables_to_parquet', 'Parquet')
+        }[job['type']]
+        output_name = f"{Path(job['file_name']).stem}{suffix}"
+        output_path = self._output_path(job, output_name)
+        
+        try:
+            reporter = self._start_progress(bot, job, "Извлекаю таблицы...")
+            tables = await self._run_converter(
+                job,
+                method,
+                str(pdf_path),
+                str(output_path),
+                progress=reporter.callback(),
+                **self._page_kwargs(job)
+            )
             
+            job['tables'] = tables
+            if tables and output_path.exists():
+                send_success = await self._send_file_with_timeout(
+                    bot,
+                    job['chat_id'],
+                    output_path,
+                    output_name,
+                    f"✅ <b>Таблицы извлечены!</b>\n"
+                    f"🧾 {job['file_name']} → {output_name} ({tables} табл., {label})"
+                )
+                
+                if send_success:
+                    await self._edit_status(bot, job, f"✅ Таблицы успешно экспортированы в {label}!")
+                else:
+                    await self._edit_status(
+                        bot, job,
+                        "❌ Ошибка при отправке файла!\n"
+                        "Экспорт прошел успешно, но не удалось отправить результат."
+                    )
+            else:
+                await self._edit_status(bot, job, "❌ Таблицы в документе не найдены!")
+                
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Превышено время конвертации!</b>\n\n"
+                "Файл слишком большой или сложный для обработки.\n"
+                "Попробуйте отправить файл меньшего размера."
+            )
+            logger.error(f"Таймаут экспорта таблиц в {label} для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            logger.info(f"Экспорт таблиц файла {job['file_name']} остановлен пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            logger.error(f"Превышен лимит памяти при экспорте таблиц файла {job['file_name']}")
+        except Exception as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка экспорта таблиц!")
+            logger.error(f"Ошибка экспорта таблиц в {label}: {e}")
+        finally:
             self.converter.cleanup_temp_files(str(output_path))
-        else:
-            await query.edit_message_text("❌ Ошибка конвертации в Excel!")
     
-    async def _extract_text_only_async(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                                      pdf_path: Path, file_info: dict):
-        """Извлекает только текст из PDF с таймаутом"""
-        query = update.callback_query
+    async def _compress_pdf_async(self, bot, job: dict, pdf_path: Path):
+        """Сжимает PDF и сообщает размер до и после"""
+        output_name = f"{Path(job['file_name']).stem}_compressed.pdf"
+        output_path = self._output_path(job, output_name)
         
         try:
-            # Извлекаем текст с таймаутом
-            text = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
-                    self.converter.extract_text_only,
-                    str(pdf_path)
-                ),
-                timeout=TIMEOUT_SETTINGS['conversion']
+            reporter = self._start_progress(bot, job, "Сжимаю PDF...")
+            # Размер до сжатия - у выбранных страниц, а не у всего файла
+            size_before = await self._run_converter(
+                job,
+                'compress_pdf',
+                str(pdf_path),
+                str(output_path),
+                progress=reporter.callback(),
+                **self._page_kwargs(job)
             )
             
-            if text:
-                # Создаем текстовый файл
-                output_name = file_info['file_name'].replace('.pdf', '.txt')
-                output_path = self.temp_dir / output_name
-                
-                with open(output_path, 'w', encoding='utf-8') as txt_file:
-                    txt_file.write(text)
+            if size_before and output_path.exists():
+                size_after = output_path.stat().st_size
+                saved = max(0, 100 - size_after * 100 // max(size_before, 1))
+                sizes = (f"📏 {FileManager.format_file_size(size_before)} → "
+                         f"{FileManager.format_file_size(size_after)} (−{saved}%)")
                 
-                # Отправляем результат с таймаутом
                 send_success = await self._send_file_with_timeout(
-                    context.bot,
-                    query.message.chat_id,
+                    bot,
+                    job['chat_id'],
                     output_path,
                     output_name,
-                    f"✅ <b>Текст извлечен!</b>\n"
-                    f"📝 {file_info['file_name']} → {output_name}"
+                    f"✅ <b>PDF сжат!</b>\n"
+                    f"🗜 {job['file_name']} → {output_name}\n"
+                    f"{sizes}"
                 )
                 
                 if send_success:
-                    await query.edit_message_text("✅ Текст успешно извлечен!")
+                    await self._edit_status(bot, job, f"✅ PDF успешно сжат!\n{sizes}")
                 else:
-                    await query.edit_message_text(
+                    await self._edit_status(
+                        bot, job,
                         "❌ Ошибка при отправке файла!\n"
-                        "Текст извлечен успешно, но не удалось отправить результат."
+                        "Сжатие прошло успешно, но не удалось отправить результат."
                     )
-                
-                self.converter.cleanup_temp_files(str(output_path))
             else:
-                await query.edit_message_text("❌ Не удалось извлечь текст из файла!")
+                await self._edit_status(bot, job, "❌ Ошибка при сжатии PDF!")
                 
-        except asyncio.TimeoutError:
-            await query.edit_message_text(
-                "⏰ <b>Превышено время обработки!</b>\n\n"
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Превышено время конвертации!</b>\n\n"
                 "Файл слишком большой или сложный для обработки.\n"
                 "Попробуйте отправить файл меньшего размера."
             )
-            logger.error(f"Таймаут извлечения текста для файла {file_info['file_name']}")
+            logger.error(f"Таймаут сжатия файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            logger.info(f"Сжатие файла {job['file_name']} остановлено пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            logger.error(f"Превышен лимит памяти при сжатии файла {job['file_name']}")
         except Exception as e:
-            await query.edit_message_text("❌ Не удалось извлечь текст из файла!")
-            logger.error(f"Ошибка извлечения текста: {e}")
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка при сжатии PDF!")
+            logger.error(f"Ошибка сжатия PDF: {e}")
+        finally:
+            self.converter.cleanup_temp_files(str(output_path))
     
-    async def _extract_text_only(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                                pdf_path: Path, file_info: dict):
-        """Извлекает только текст из PDF"""
-        query = update.callback_query
+    def _write_zip_parts(self, files: List[Tuple[Path, str]], directory: Path,
+                         archive_stem: str) -> List[Path]:
+        """Раскладывает файлы по ZIP-архивам не больше лимита отправки"""
+        part_limit = BATCH_SETTINGS['zip_part_size']
+        parts = []
+        archive = None
+        part_size = 0
+        try:
+            for path, name in files:
+                size = path.stat().st_size
+                if archive and part_size + size > part_limit:
+                    archive.close()
+                    archive = None
+                if archive is None:
+                    parts.append(directory / f"{archive_stem}_part{len(parts) + 1}.zip")
+                    archive = zipfile.ZipFile(parts[-1], 'w')
+                    part_size = 0
+                # Изображения уже сжаты - сохраняем без повторного сжатия
+                archive.write(path, name, compress_type=zipfile.ZIP_STORED)
+                part_size += size
+        finally:
+            if archive:
+                archive.close()
         
-        # Извлекаем текст
-        text = self.converter.extract_text_only(str(pdf_path))
+        if len(parts) == 1:
+            single = parts[0].with_name(f"{archive_stem}.zip")
+            parts[0].rename(single)
+            parts = [single]
+        return parts
+    
+    async def _convert_to_images_async(self, bot, job: dict, pdf_path: Path):
+        """Рендерит страницы PDF в изображения.
+
+        Диапазон делится на части по pages_per_task страниц, которые
+        рендерятся параллельно в разных воркерах пула.
+        """
+        stem = Path(job['file_name']).stem
+        image_format, dpi = job['image_format'], job['dpi']
+        output_dir = self.temp_dir / f"images_{job['chat_id']}_{job['message_id']}"
+        output_dir.mkdir(exist_ok=True)
         
-        if text:
-            # Создаем текстовый файл
-            output_name = file_info['file_name'].replace('.pdf', '.txt')
-            output_path = self.temp_dir / output_name
-            
-            with open(output_path, 'w', encoding='utf-8') as txt_file:
-                txt_file.write(text)
+        info = job.get('preflight') or {}
+        start, end = job.get('page_range') or (0, info.get('total_pages'))
+        step = IMAGE_EXPORT_SETTINGS['pages_per_task']
+        ranges = [(first, min(first + step, end)) for first in range(start, end, step)] if end else [(start, None)]
+        
+        reporter = self._start_progress(bot, job, "Рендерю страницы...")
+        rendered = {}
+        
+        def progress_for(index: int):
+            def progress(done, total):
+                rendered[index] = done
+                reporter.update('', sum(rendered.values()), end - start if end else total)
+            return progress
+        
+        try:
+            started = time.monotonic()
+            results = await asyncio.gather(*(
+                self._run_converter(
+                    job, 'render_pages', str(pdf_path), str(output_dir), image_format, dpi,
+                    start=first, end=last, calibrate=False, progress=progress_for(index)
+                )
+                for index, (first, last) in enumerate(ranges)
+            ))
+            files = [(Path(path), f"{stem}_{Path(path).name}") for paths in results for path in paths]
+            expected = end - start if end else len(files)
+            if not files or len(files) < expected:
+                await self._edit_status(bot, job, "❌ Ошибка рендера страниц!")
+                return
+            if job.get('preflight'):
+                self.cost_model.record(job['type'], job['preflight'], time.monotonic() - started)
             
-            # Отправляем результат с таймаутом
-            send_success = await self._send_file_with_timeout(
-                context.bot,
-                query.message.chat_id,
-                output_path,
-                output_name,
-                f"✅ <b>Текст извлечен!</b>\n"
-                f"📝 {file_info['file_name']} → {output_name}"
+            caption = (
+                f"✅ <b>Страницы готовы!</b>\n"
+                f"🖼 {job['file_name']} → {len(files)} × {image_format.upper()}, {dpi} DPI"
             )
+            if len(files) <= IMAGE_EXPORT_SETTINGS['media_group_limit']:
+                send_success = await self._send_files_with_timeout(bot, job['chat_id'], files, caption)
+            else:
+                archives = await asyncio.get_event_loop().run_in_executor(
+                    None, self._write_zip_parts, files, output_dir, f"{stem}_{image_format}"
+                )
+                send_success = True
+                for number, archive_path in enumerate(archives, 1):
+                    part = f" (часть {number} из {len(archives)})" if len(archives) > 1 else ""
+                    send_success = await self._send_file_with_timeout(
+                        bot, job['chat_id'], archive_path, archive_path.name, caption + part
+                    ) and send_success
             
             if send_success:
-                await query.edit_message_text("✅ Текст успешно извлечен!")
+                await self._edit_status(bot, job, "✅ Страницы успешно преобразованы в изображения!")
             else:
-                await query.edit_message_text(
-                    "❌ Ошибка при отправке файла!\n"
-                    "Текст извлечен успешно, но не удалось отправить результат."
+                await self._edit_status(
+                    bot, job,
+                    "❌ Ошибка при отправке файлов!\n"
+                    "Рендер прошел успешно, но не удалось отправить результат."
                 )
-            
-            self.converter.cleanup_temp_files(str(output_path))
-        else:
-            await query.edit_message_text("❌ Не удалось извлечь текст из файла!")
+        
+        except asyncio.TimeoutError as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(
+                bot, job,
+                "⏰ <b>Превышено время конвертации!</b>\n\n"
+                "Файл слишком большой или сложный для обработки.\n"
+                "Попробуйте отправить файл меньшего размера."
+            )
+            logger.error(f"Таймаут рендера страниц для файла {job['file_name']}")
+        except ConversionCancelled:
+            await self._edit_status(bot, job, "⏹ Конвертация остановлена.")
+            logger.info(f"Рендер страниц файла {job['file_name']} остановлен пользователем")
+        except MemoryLimitExceeded:
+            await self._edit_status(bot, job, MEMORY_LIMIT_MESSAGE)
+            logger.error(f"Превышен лимит памяти при рендере страниц файла {job['file_name']}")
+        except Exception as e:
+            if self._retry_in_queue(job, e):
+                raise
+            await self._edit_status(bot, job, "❌ Ошибка рендера страниц!")
+            logger.error(f"Ошибка рендера страниц: {e}")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
     
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
@@ -626,6 +1837,17 @@ class PDFBot:
             except Exception as e:
                 logger.error(f"Ошибка при отправке сообщения об ошибке: {e}")
 
+def bot_api_options() -> dict:
+    """Параметры подключения к Bot API (общие для бота и воркеров очереди)"""
+    options = {}
+    if BOT_API_SETTINGS['base_url']:
+        options['base_url'] = BOT_API_SETTINGS['base_url']
+    if BOT_API_SETTINGS['base_file_url']:
+        options['base_file_url'] = BOT_API_SETTINGS['base_file_url']
+    if BOT_API_SETTINGS['local_mode']:
+        options['local_mode'] = True
+    return options
+
 def main():
     """Основная функция запуска бота"""
     if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
@@ -637,21 +1859,32 @@ def main():
     bot = PDFBot()
     
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(BOT_TOKEN).post_init(bot.post_init)
+    for option, value in bot_api_options().items():
+        builder = getattr(builder, option)(value)
+    application = builder.build()
     
     # Добавляем обработчики
+    application.add_handler(TypeHandler(Update, bot.track_first_update), group=-1)
     application.add_handler(CommandHandler("start", bot.start_command))
     application.add_handler(CommandHandler("help", bot.help_command))
     application.add_handler(CommandHandler("info", bot.info_command))
     application.add_handler(MessageHandler(filters.Document.ALL, bot.handle_document))
-    application.add_handler(CallbackQueryHandler(bot.handle_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_text))
+    application.add_handler(CallbackQueryHandler(bot.handle_stop, pattern=r'^stop$'))
+    # Конвертация выполняется в фоне, чтобы обновления (в том числе кнопка
+    # остановки) обрабатывались, пока она идет
+    application.add_handler(CallbackQueryHandler(bot.handle_callback, block=False))
     
     # Добавляем обработчик ошибок
     application.add_error_handler(bot.error_handler)
     
     # Запускаем бота
     print("🤖 Бот запущен! Нажмите Ctrl+C для остановки.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        bot.pool.close()
 
 if __name__ == '__main__':
     main()
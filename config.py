@@ -7,11 +7,26 @@ load_dotenv()
 # Токен бота (получите у @BotFather)
 BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 
-# Максимальный размер файла в байтах (20MB)
-MAX_FILE_SIZE = 20 * 1024 * 1024
+# Собственный сервер Bot API (https://github.com/tdlib/telegram-bot-api).
+# Пустой base_url означает публичный api.telegram.org
+BOT_API_SETTINGS = {
+    'base_url': os.getenv('BOT_API_BASE_URL', ''),            # например http://telegram-bot-api:8081/bot
+    'base_file_url': os.getenv('BOT_API_BASE_FILE_URL', ''),  # например http://telegram-bot-api:8081/file/bot
+    'local_mode': os.getenv('BOT_API_LOCAL_MODE', '').lower() in ('1', 'true', 'yes'),
+    # Сервер видит TEMP_DIR по тому же пути и принимает результаты по пути к файлу.
+    # false - результаты передаются содержимым (сервер на другой машине)
+    'upload_by_path': os.getenv('BOT_API_UPLOAD_BY_PATH', 'true').lower() in ('1', 'true', 'yes')
+}
+
+# Максимальный размер файла в байтах: 20MB для публичного Bot API,
+# до 2000MB для локального сервера
+MAX_FILE_SIZE = int(
+    os.getenv('MAX_FILE_SIZE') or
+    (2000 if BOT_API_SETTINGS['local_mode'] else 20) * 1024 * 1024
+)
 
 # Временная папка для обработки файлов
-TEMP_DIR = 'temp_files'
+TEMP_DIR = os.getenv('TEMP_DIR', 'temp_files')
 
 # Поддерживаемые форматы
 SUPPORTED_FORMATS = {
@@ -31,10 +46,176 @@ CONVERSION_SETTINGS = {
     }
 }
 
+# Кнопки быстрого выбора первых N страниц документа
+PAGE_RANGE_BUTTONS = (5, 20)
+
 # Настройки таймаутов (в секундах)
 TIMEOUT_SETTINGS = {
     'file_download': 300,  # 5 минут для скачивания файла
     'file_upload': 300,    # 5 минут для загрузки файла
     'conversion': 600,     # 10 минут для конвертации
     'telegram_request': 30 # 30 секунд для запросов к Telegram API
-}
\ No newline at end of file
+}
+
+# Очередь задач конвертации. Если включена, бот только принимает файлы
+# и ставит задачи в очередь, а конвертацию выполняют процессы worker.py
+# (в том числе на других узлах с общим TEMP_DIR и файлом базы)
+QUEUE_SETTINGS = {
+    'enabled': os.getenv('QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'db_path': os.getenv('QUEUE_DB_PATH', os.path.join(TEMP_DIR, 'jobs.sqlite3')),
+    'lease_seconds': 60,    # Аренда задачи воркером, продлевается во время работы
+    'max_attempts': 3,      # Сколько раз задача может быть взята в работу
+    'retry_delay': 30,      # Задержка перед повторной попыткой (секунды)
+    'poll_interval': 1.0,   # Период опроса очереди воркером (секунды)
+    'purge_interval': 3600, # Период очистки завершенных задач (секунды)
+    'purge_age': 24 * 3600  # Возраст завершенных задач, которые удаляются (секунды)
+}
+
+
+# Процессы-воркеры конвертации (worker_pool.py)
+WORKER_SETTINGS = {
+    'workers': int(os.getenv('CONVERSION_WORKERS', 2)),
+    # Лимит резидентной памяти на одну задачу (MB), 0 - без лимита
+    'memory_limit_mb': int(os.getenv('WORKER_MEMORY_LIMIT_MB', 1024)),
+    # Жесткий лимит адресного пространства процесса (MB), 0 - без лимита
+    'address_space_limit_mb': int(os.getenv('WORKER_ADDRESS_SPACE_LIMIT_MB', 0)),
+    # Перезапуск воркера после N задач или при разрастании памяти свыше X MB
+    'recycle_after_jobs': int(os.getenv('WORKER_RECYCLE_AFTER_JOBS', 50)),
+    'recycle_rss_mb': int(os.getenv('WORKER_RECYCLE_RSS_MB', 512)),
+    # Запускать воркеры при старте и заранее импортировать в них тяжелые библиотеки
+    'prewarm': os.getenv('WORKER_PREWARM', 'true').lower() in ('1', 'true', 'yes'),
+    # Сколько секунд ждать остановки на границе страницы после отмены,
+    # прежде чем завершить процесс воркера принудительно
+    'cancel_grace': 10
+}
+
+
+# Модель стоимости конвертации (cost_model.py): таймаут и ETA подбираются
+# под документ, заведомо неподъемные задачи отклоняются до начала работы
+COST_MODEL_SETTINGS = {
+    'stats_path': os.getenv('COST_MODEL_STATS', os.path.join(TEMP_DIR, 'cost_model.json')),
+    'safety_factor': 3.0,   # Запас таймаута относительно прогноза
+    'margin': 30,           # Постоянная добавка к таймауту (секунды)
+    'min_timeout': 60,      # Минимальный таймаут конвертации (секунды)
+    'max_timeout': int(os.getenv('MAX_CONVERSION_TIME', 1800)),  # Задачи с прогнозом выше - отклоняются
+    'learning_rate': 0.2    # Скорость подстройки по фактическим замерам
+}
+
+
+# Ограничение нагрузки на пользователя (token bucket в оценочных CPU-секундах)
+RATE_LIMIT_SETTINGS = {
+    'enabled': os.getenv('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'capacity': float(os.getenv('RATE_LIMIT_CAPACITY', 900)),           # Максимальная квота (CPU-секунды)
+    'refill_per_hour': float(os.getenv('RATE_LIMIT_REFILL_PER_HOUR', 900)),
+    'default_cost': 10.0    # Стоимость задачи без прогноза модели стоимости
+}
+
+
+
+# Конвейер обработки: скачивание -> конвертация -> отправка. У каждого
+# этапа свой лимит параллельности (конвертация - по числу воркеров пула)
+# и очередь; при переполненной очереди задачи ждут на предыдущем этапе
+PIPELINE_SETTINGS = {
+    'download_workers': int(os.getenv('DOWNLOAD_WORKERS', 4)),
+    'upload_workers': int(os.getenv('UPLOAD_WORKERS', 4)),
+    'queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', 8))     # Ожидающих задач на этап
+}
+
+# Пакетная обработка: документы альбома или присланные подряд
+# конвертируются вместе и возвращаются ZIP-архивами
+BATCH_SETTINGS = {
+    'window': 5.0,              # Окно сбора документов в пакет (секунды)
+    'max_files': 30,            # Максимум файлов в пакете
+    'menu_update_delay': 1.0,   # Задержка обновления меню пакета (секунды)
+    'progress_interval': 3.0,   # Не чаще одного обновления статуса (секунды)
+    # Предельный размер одной части ZIP: лимит отправки 50MB (2000MB локально)
+    'zip_part_size': (1900 if BOT_API_SETTINGS['local_mode'] else 45) * 1024 * 1024
+}
+
+
+# Постепенная выдача текста: первые страницы приходят сразу,
+# короткий текст - сообщениями без загрузки файла
+TEXT_DELIVERY_SETTINGS = {
+    'single_chunk_pages': 10,   # Документы до N страниц обрабатываются одной порцией
+    'first_chunk_pages': 3,     # Размер первой порции (страниц)
+    'max_chunk_pages': 50,      # Максимальный размер порции (страниц)
+    'inline_limit': 4000,       # Порции короче отправляются сообщением (лимит Telegram - 4096)
+    'max_inline_messages': 3    # Не больше N сообщений, дальше - файлы
+}
+
+
+# Отображение прогресса конвертации
+PROGRESS_SETTINGS = {
+    'edit_interval': 3.0,     # Не чаще одной правки сообщения в чате за N секунд
+    'worker_interval': 0.5    # Как часто воркер пересылает прогресс боту (секунды)
+}
+
+
+# Изображения в DOCX. Политики от мягкой к жесткой:
+# original - как в PDF, downsample - уменьшить до target_dpi при размере
+# на странице, jpeg - уменьшить и пережать в JPEG, drop - убрать изображения.
+# Если DOCX больше max_output_size, политика ужесточается по этой цепочке
+DOCX_IMAGE_SETTINGS = {
+    'policy': os.getenv('DOCX_IMAGE_POLICY', 'downsample'),
+    'target_dpi': int(os.getenv('DOCX_IMAGE_DPI', 150)),
+    'jpeg_quality': int(os.getenv('DOCX_JPEG_QUALITY', 75)),
+    # Ограничивает размер, а с ним и время отправки результата (лимит отправки 50MB)
+    'max_output_size': int(
+        os.getenv('DOCX_MAX_OUTPUT_SIZE') or
+        (200 if BOT_API_SETTINGS['local_mode'] else 45) * 1024 * 1024
+    )
+}
+
+
+# Страницы-сканы (без текстового слоя, почти целиком изображение) не идут
+# через разбор макета: в Word они вставляются картинками, текст с них
+# распознается локальным OCR (pytesseract + tesseract), если он включен
+SCAN_SETTINGS = {
+    'min_text_chars': 20,       # Меньше символов в текстовом слое - текста нет
+    'min_image_coverage': 0.6,  # Доля площади страницы, занятая изображениями
+    'ocr_enabled': os.getenv('OCR_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+    'ocr_languages': os.getenv('OCR_LANGUAGES', 'rus+eng'),
+    'ocr_dpi': int(os.getenv('OCR_DPI', 300)),
+    'ocr_threads': int(os.getenv('OCR_THREADS', 2))
+}
+
+
+# Рендер страниц в изображения
+IMAGE_EXPORT_SETTINGS = {
+    'formats': ('png', 'jpeg', 'webp'),
+    'dpi_options': (96, 150, 300),
+    'quality': 85,                  # Качество JPEG/WebP
+    'max_pixels': 40_000_000,       # Предел пикселей на страницу: выше - DPI снижается
+    'pages_per_task': 10,           # Страниц на одну задачу воркера (рендер идет параллельно)
+    'media_group_limit': 10,        # До N изображений - альбомом, больше - ZIP-архивом
+    # Превью первой страницы при получении файла (файлы больше не скачиваются ради превью)
+    'preview_max_file_size': 5 * 1024 * 1024,
+    'preview_size': 320
+}
+
+
+# Сжатие PDF: изображения уменьшаются до dpi при размере на странице
+# и пережимаются в JPEG, шрифты урезаются до используемых символов
+COMPRESS_SETTINGS = {
+    'dpi': int(os.getenv('COMPRESS_DPI', 150)),
+    'jpeg_quality': int(os.getenv('COMPRESS_JPEG_QUALITY', 75)),
+    'min_image_bytes': 20 * 1024    # Изображения меньше не трогаем
+}
+
+
+# Состояние пользователей между сообщениями (загруженный файл, пакет)
+SESSION_SETTINGS = {
+    'ttl': int(os.getenv('SESSION_TTL', 3600)),                 # Время жизни без активности (секунды)
+    'max_entries': int(os.getenv('SESSION_MAX_ENTRIES', 10000)),
+    # Файл SQLite, чтобы сессии переживали перезапуск; пусто - только в памяти
+    'db_path': os.getenv('SESSION_DB_PATH', ''),
+    'cache_entries': 1000,      # Сессий в памяти при хранении на диске
+    'cleanup_every': 100        # Чистка диска раз в N записей
+}
+
+
+# Запись анонимных трасс задач (JSONL) для планирования мощностей: replay.py
+TRACE_SETTINGS = {
+    'enabled': os.getenv('TRACE_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'path': os.getenv('TRACE_PATH', os.path.join(TEMP_DIR, 'traces.jsonl'))
+}
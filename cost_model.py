@@ -0,0 +1,105 @@
+import json
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict
+
+from config import COST_MODEL_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Априорные коэффициенты (секунды): база + на страницу + на изображение +
+# на шрифт + на страницу без текстового слоя
+DEFAULT_COEFFICIENTS = {
+    'convert_word': {'base': 2.0, 'page': 0.6, 'image': 0.15, 'font': 0.05, 'scan_page': 0.4},
+    'convert_excel': {'base': 1.0, 'page': 0.35, 'image': 0.0, 'font': 0.02, 'scan_page': 0.1},
+    'convert_text': {'base': 0.5, 'page': 0.08, 'image': 0.0, 'font': 0.01, 'scan_page': 0.02},
+    # Word и общий проход текст+таблицы идут параллельно - время близко к Word
+    'convert_all': {'base': 2.5, 'page': 0.7, 'image': 0.15, 'font': 0.06, 'scan_page': 0.4},
+    # Таблицы без сериализации в Excel
+    'convert_csv': {'base': 0.5, 'page': 0.3, 'image': 0.0, 'font': 0.02, 'scan_page': 0.02},
+    'convert_parquet': {'base': 1.0, 'page': 0.3, 'image': 0.0, 'font': 0.02, 'scan_page': 0.02},
+    # Рендер страниц без разбора макета - самый дешевый тип
+    'convert_images': {'base': 0.5, 'page': 0.15, 'image': 0.02, 'font': 0.0, 'scan_page': 0.05},
+    # Сжатие: пережатие изображений и урезание шрифтов
+    'convert_compress': {'base': 1.0, 'page': 0.05, 'image': 0.1, 'font': 0.1, 'scan_page': 0.1}
+}
+
+class CostModel:
+    """Прогноз длительности конвертации по данным предварительного анализа.
+
+    Прогноз = априорная линейная оценка * поправочный коэффициент типа
+    конвертации. Коэффициент подстраивается по фактическим замерам
+    (экспоненциальное сглаживание в логарифмической шкале) и сохраняется
+    в JSON, чтобы калибровка переживала перезапуски.
+    """
+
+    def __init__(self, stats_path: str = COST_MODEL_SETTINGS['stats_path'],
+                 learning_rate: float = COST_MODEL_SETTINGS['learning_rate']):
+        self.stats_path = Path(stats_path)
+        self.learning_rate = learning_rate
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        """Загружает накопленную калибровку"""
+        try:
+            with open(self.stats_path, encoding='utf-8') as stats_file:
+                return json.load(stats_file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Ошибка чтения калибровки модели стоимости: {e}")
+            return {}
+
+    def _save(self):
+        """Атомарно сохраняет калибровку"""
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.stats_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as stats_file:
+                json.dump(self.stats, stats_file)
+            os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения калибровки модели стоимости: {e}")
+
+    @staticmethod
+    def prior(conversion_type: str, info: dict) -> float:
+        """Априорная оценка длительности (секунды)"""
+        coef = DEFAULT_COEFFICIENTS.get(conversion_type, DEFAULT_COEFFICIENTS['convert_word'])
+        pages = info.get('pages', 0)
+        scan_pages = max(0, pages - info.get('text_pages', pages))
+        return (coef['base'] +
+                coef['page'] * pages +
+                coef['image'] * info.get('images', 0) +
+                coef['font'] * info.get('fonts', 0) +
+                coef['scan_page'] * scan_pages)
+
+    def predict(self, conversion_type: str, info: dict) -> float:
+        """Прогноз длительности конвертации (секунды)"""
+        scale = math.exp(self.stats.get(conversion_type, {}).get('log_scale', 0.0))
+        return self.prior(conversion_type, info) * scale
+
+    def timeout_for(self, estimate: float) -> float:
+        """Таймаут конвертации для задачи с данным прогнозом"""
+        timeout = estimate * COST_MODEL_SETTINGS['safety_factor'] + COST_MODEL_SETTINGS['margin']
+        return min(max(timeout, COST_MODEL_SETTINGS['min_timeout']), COST_MODEL_SETTINGS['max_timeout'])
+
+    def exceeds_limits(self, estimate: float) -> bool:
+        """Задача заведомо не уложится в максимальное время"""
+        return estimate > COST_MODEL_SETTINGS['max_timeout']
+
+    def record(self, conversion_type: str, info: dict, seconds: float):
+        """Учитывает фактическую длительность выполненной задачи"""
+        prior = self.prior(conversion_type, info)
+        if prior <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            entry = self.stats.setdefault(conversion_type, {'log_scale': 0.0, 'samples': 0})
+            # Первые замеры весят больше, чтобы калибровка быстро сошлась
+            rate = max(self.learning_rate, 1.0 / (entry['samples'] + 1))
+            entry['log_scale'] += rate * (math.log(seconds / prior) - entry['log_scale'])
+            entry['samples'] += 1
+            self._save()
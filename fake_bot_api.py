@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Сервер-заглушка Bot API для проверки бота без Telegram.
+
+Отдает боту сообщение с PDF-файлом, нажимает кнопки меню по их
+callback_data и сохраняет присланные результаты. С --local сервер ведет
+себя как telegram-bot-api в режиме --local: getFile возвращает путь к
+файлу на диске, а результаты принимаются по пути к файлу (file://).
+Путь, который серверу не виден, дает ошибку, как у настоящего сервера.
+
+Пример:
+    python fake_bot_api.py sample.pdf --press convert_word --local
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot \\
+    BOT_API_BASE_FILE_URL=http://127.0.0.1:8081/file/bot \\
+    BOT_API_LOCAL_MODE=true python bot.py
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import parse_qsl, unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+CHAT = {'id': 1001, 'type': 'private', 'first_name': 'Test'}
+USER = {'id': 1001, 'is_bot': False, 'first_name': 'Test'}
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+class FakeBotAPI:
+    """Состояние заглушки: очередь обновлений, сообщения и полученные файлы"""
+
+    def __init__(self, pdf_path: str, presses: List[str], local: bool, received_dir: str):
+        self.pdf_path = Path(pdf_path).resolve()
+        self.presses = list(presses)
+        self.local = local
+        self.received_dir = Path(received_dir)
+        self.received_dir.mkdir(parents=True, exist_ok=True)
+        self.updates = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.received = 0
+        self._condition = threading.Condition()
+
+    def _message(self, text: Optional[str] = None, **fields) -> dict:
+        message = {'message_id': self.next_message_id, 'date': int(time.time()), 'chat': CHAT}
+        self.next_message_id += 1
+        if text is not None:
+            message['text'] = text
+        message.update(fields)
+        return message
+
+    def _push(self, **update):
+        with self._condition:
+            update['update_id'] = self.next_update_id
+            self.next_update_id += 1
+            self.updates.append(update)
+            self._condition.notify_all()
+
+    def send_pdf(self):
+        """Сообщение пользователя с PDF-файлом"""
+        self._push(message=self._message(**{'from': USER}, document={
+            'file_id': 'pdf',
+            'file_unique_id': 'pdf',
+            'file_name': self.pdf_path.name,
+            'mime_type': 'application/pdf',
+            'file_size': self.pdf_path.stat().st_size
+        }))
+
+    def _press_button(self, message: dict, markup: Optional[dict]):
+        """Нажимает следующую кнопку из --press, если она есть в сообщении"""
+        if not self.presses or not markup:
+            return
+        buttons = [button.get('callback_data') for row in markup.get('inline_keyboard', []) for button in row]
+        if self.presses[0] not in buttons:
+            return
+        data = self.presses.pop(0)
+        logger.info(f"Нажата кнопка {data}")
+        self._push(callback_query={
+            'id': str(self.next_update_id),
+            'from': USER,
+            'chat_instance': 'fake',
+            'message': message,
+            'data': data
+        })
+
+    def get_updates(self, offset: int, timeout: float) -> list:
+        with self._condition:
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            if not self.updates and timeout:
+                self._condition.wait(timeout)
+            return list(self.updates)
+
+    def _save(self, name: str, source) -> Path:
+        """Сохраняет полученный файл (путь или байты) в папку результатов"""
+        self.received += 1
+        target = self.received_dir / f"{self.received}_{Path(name).name}"
+        if isinstance(source, Path):
+            shutil.copyfile(source, target)
+        else:
+            target.write_bytes(source)
+        logger.info(f"📎 Получен файл {target} ({target.stat().st_size} байт)")
+        return target
+
+    def _receive(self, value: str, files: dict, filename: Optional[str] = None):
+        """Принимает файл из параметра запроса: attach://, file:// или вложение.
+
+        Ошибка - строка с описанием, как в ответе Bot API.
+        """
+        if value.startswith('attach://'):
+            name, data = files[value[len('attach://'):]]
+            self._save(filename or name, data)
+            return None
+        if value.startswith('file://'):
+            if not self.local:
+                return "Bad Request: wrong remote file identifier specified"
+            path = Path(unquote(urlparse(value).path))
+            if not path.is_file():
+                return f"Bad Request: file {path} not found"
+            self._save(filename or path.name, path)
+            return None
+        return "Bad Request: unsupported file reference in fake server"
+
+    def call(self, method: str, params: dict, files: dict):
+        """Выполняет метод Bot API. Возвращает (ok, результат или описание ошибки)"""
+        method = method.lower()
+        if method == 'getme':
+            return True, BOT_USER
+        if method == 'getupdates':
+            return True, self.get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if method == 'getfile':
+            file_path = str(self.pdf_path) if self.local else 'documents/file_0.pdf'
+            return True, {'file_id': 'pdf', 'file_unique_id': 'pdf',
+                          'file_size': self.pdf_path.stat().st_size, 'file_path': file_path}
+        if method in ('sendmessage', 'editmessagetext', 'sendphoto'):
+            markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+            message = self._message(params.get('text') or params.get('caption') or '')
+            if method == 'editmessagetext':
+                message['message_id'] = int(params.get('message_id') or message['message_id'])
+            if markup:
+                message['reply_markup'] = markup
+            logger.info(f"{method}: {message['text'][:80]!r}")
+            self._press_button(message, markup)
+            return True, message
+        if method == 'senddocument':
+            if 'document' in files:
+                # Файл передан содержимым прямо в поле document
+                self._save(*files['document'])
+                return True, self._message()
+            error = self._receive(params.get('document', ''), files, params.get('filename'))
+            return (False, error) if error else (True, self._message())
+        if method == 'sendmediagroup':
+            messages = []
+            for media in json.loads(params.get('media', '[]')):
+                error = self._receive(media.get('media', ''), files, media.get('filename'))
+                if error:
+                    return False, error
+                messages.append(self._message())
+            return True, messages
+        return True, True
+
+def _parse_body(content_type: str, body: bytes):
+    """Параметры и вложения запроса: форма, multipart или JSON"""
+    params, files = {}, {}
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            data = part.get_payload(decode=True) or b''
+            if part.get_filename():
+                files[name] = (part.get_filename(), data)
+            else:
+                params[name] = data.decode('utf-8')
+    elif content_type.startswith('application/json'):
+        params = {key: value if isinstance(value, str) else json.dumps(value)
+                  for key, value in json.loads(body or b'{}').items()}
+    else:
+        params = dict(parse_qsl(body.decode('utf-8')))
+    return params, files
+
+def make_handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, payload: dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # Скачивание файла без локального режима: /file/bot<token>/<file_path>
+            if self.path.startswith('/file/') and not api.local:
+                data = api.pdf_path.read_bytes()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+        def do_POST(self):
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            params, files = _parse_body(self.headers.get('Content-Type', ''), body)
+            ok, result = api.call(method, params, files)
+            if ok:
+                self._reply(200, {'ok': True, 'result': result})
+            else:
+                logger.warning(f"{method}: {result}")
+                self._reply(400, {'ok': False, 'error_code': 400, 'description': result})
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+def main():
+    """Точка входа: запуск заглушки с одним PDF-файлом"""
+    parser = argparse.ArgumentParser(description="Сервер-заглушка Bot API для проверки бота")
+    parser.add_argument('pdf', help="PDF-файл, который «отправит» пользователь")
+    parser.add_argument('--press', nargs='*', default=['convert_word'],
+                        help="callback_data кнопок, которые нажать по очереди")
+    parser.add_argument('--local', action='store_true',
+                        help="Вести себя как telegram-bot-api --local (пути к файлам вместо HTTP)")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--received-dir', default='fake_bot_api_received',
+                        help="Куда сохранять присланные ботом файлы")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    api = FakeBotAPI(args.pdf, args.press, args.local, args.received_dir)
+    api.send_pdf()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(api))
+    print(f"🧪 Заглушка Bot API: http://127.0.0.1:{args.port}/bot (локальный режим: {args.local})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,50 @@
 import os
+import io
+import csv
+import zipfile
 import tempfile
 import logging
 import asyncio
+import time
+import shutil
+import importlib
+import importlib.util
 from pathlib import Path
-from typing import Optional, Tuple
-import fitz  # PyMuPDF
-import pdfplumber
-from pdf2docx import Converter
-import pandas as pd
-from docx import Document
-from docx.shared import Inches
-import io
+from typing import Optional, Tuple, Callable, List, Set, Dict, Iterator
+
+from config import DOCX_IMAGE_SETTINGS, SCAN_SETTINGS, IMAGE_EXPORT_SETTINGS, COMPRESS_SETTINGS
+
+# Прогресс конвертации: (обработано страниц, всего страниц)
+ProgressCallback = Callable[[int, int], None]
+# Проверка отмены: True - пользователь остановил конвертацию
+CancelCheck = Callable[[], bool]
+
+# Тяжелые библиотеки (PyMuPDF, pdfplumber, pdf2docx, pandas, python-docx)
+# импортируются при первом использовании, чтобы не замедлять запуск бота.
+# В воркерах пула они загружаются заранее через PDFConverter.warm_up()
+HEAVY_MODULES = ('fitz', 'pdfplumber', 'pdf2docx', 'pandas', 'openpyxl', 'docx', 'PIL')
+
+# Политики обработки изображений в DOCX, от мягкой к жесткой
+IMAGE_POLICIES = ('original', 'downsample', 'jpeg', 'drop')
+# Размер изображений в DOCX задается в EMU
+EMU_PER_INCH = 914400
+# Форматы дат в ячейках таблиц, в порядке проверки
+TABLE_DATE_FORMATS = ('%d.%m.%Y', '%d.%m.%y', '%Y-%m-%d', '%d/%m/%Y')
+# Число в ячейке таблицы. Точка или запятая без других разделителей -
+# десятичный знак ("12,5", "1.234"); разделитель разрядов (пробел, точка
+# или запятая) допускается только между группами из трех цифр, а
+# десятичным знаком тогда служит другой, последний разделитель
+# ("1 234,5", "1.234,56", "1,234.56")
+TABLE_NUMBER_PATTERN = (
+    r'^(?P<int>-?\d+|-?\d{1,3}(?P<group>[ \u00a0\u202f.,])\d{3}(?:(?P=group)\d{3})*)'
+    r'(?:(?!(?P=group))[.,](?P<frac>\d+))?$'
+)
 
 logger = logging.getLogger(__name__)
 
+class ConversionCancelled(Exception):
+    """Конвертация остановлена пользователем"""
+
 class PDFConverter:
     """Класс для конвертации PDF файлов в различные форматы"""
     
@@ -35,8 +66,25 @@ class PDFConverter:
             logger.error(f"Ошибка при выполнении операции {func.__name__}: {e}")
             return False
     
+    @staticmethod
+    def _checkpoint(cancel_check: Optional[CancelCheck]):
+        """Точка отмены между страницами"""
+        if cancel_check and cancel_check():
+            raise ConversionCancelled()
+    
+    def warm_up(self) -> float:
+        """Заранее импортирует тяжелые библиотеки, возвращает затраченное время"""
+        started = time.monotonic()
+        for module in HEAVY_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logger.error(f"Не удалось загрузить {module}: {e}")
+        return time.monotonic() - started
+    
     def validate_pdf(self, file_path: str) -> bool:
         """Проверяет, является ли файл валидным PDF"""
+        import fitz
         try:
             with fitz.open(file_path) as doc:
                 return len(doc) > 0
@@ -44,96 +92,927 @@ class PDFConverter:
             logger.error(f"Ошибка валидации PDF: {e}")
             return False
     
-    def extract_text_only(self, pdf_path: str) -> str:
-        """Извлекает только текст из PDF"""
+    def extract_text_only(self, pdf_path: str, start: int = 0, end: Optional[int] = None,
+                          progress_callback: Optional[ProgressCallback] = None,
+                          cancel_check: Optional[CancelCheck] = None) -> str:
+        """Извлекает только текст из PDF (страницы с start по end, не включая end).
+
+        Страницы-сканы не разбираются pdfplumber: их текст распознается OCR,
+        если он доступен, иначе они пропускаются.
+        """
+        import pdfplumber
         try:
             text = ""
+            page_numbers, image_pages = self._classify_pages(pdf_path, start, end)
+            advance = self._progress_counter(len(page_numbers), progress_callback)
+            ocr_text = self._ocr_if_available(pdf_path, image_pages, advance, cancel_check)
             with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
+                for page_number in page_numbers:
+                    self._checkpoint(cancel_check)
+                    if page_number in image_pages:
+                        page_text = ocr_text.get(page_number)
+                        if page_number not in ocr_text:
+                            advance()
+                    else:
+                        page_text = pdf.pages[page_number].extract_text()
+                        advance()
                     if page_text:
                         text += page_text + "\n\n"
             return text.strip()
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            raise
         except Exception as e:
             logger.error(f"Ошибка извлечения текста: {e}")
             return ""
     
     def convert_to_word(self, pdf_path: str, output_path: str, 
                        preserve_layout: bool = True, 
-                       include_images: bool = True) -> bool:
-        """Конвертирует PDF в Word документ"""
+                       include_images: bool = True,
+                       start: int = 0, end: Optional[int] = None,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       cancel_check: Optional[CancelCheck] = None,
+                       image_policy: Optional[str] = None,
+                       scan_page_numbers: Optional[List[int]] = None) -> bool:
+        """Конвертирует PDF в Word документ (страницы с start по end, не включая end).
+
+        Изображения обрабатываются по image_policy (по умолчанию из
+        DOCX_IMAGE_SETTINGS), include_images=False убирает их совсем.
+        scan_page_numbers - страницы-сканы из get_preflight_info, если
+        документ уже классифицирован.
+        """
+        from pdf2docx import Converter
+        from docx import Document
+        temp_docx_path = None
         try:
-            # Создаем временный файл для конвертации
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as temp_file:
+            # Создаем временный файл для конвертации рядом с результатом
+            with tempfile.NamedTemporaryFile(suffix='.docx', dir=self.temp_dir, delete=False) as temp_file:
                 temp_docx_path = temp_file.name
             
+            # Разбор макета pdf2docx ничего не даст на страницах-сканах:
+            # они вставляются изображениями страниц или, если изображения
+            # не нужны, распознанным текстом
+            image_pages = set()
+            if preserve_layout and (include_images or self.ocr_available()):
+                page_numbers, image_pages = self._classify_pages(pdf_path, start, end, scan_page_numbers)
+                if include_images and page_numbers and len(image_pages) == len(page_numbers):
+                    # Документ из одних сканов обходится без pdf2docx
+                    self._images_to_docx(pdf_path, temp_docx_path, page_numbers,
+                                         progress_callback, cancel_check)
+                    os.replace(temp_docx_path, output_path)
+                    return True
+            
             # Используем pdf2docx для конвертации
             cv = Converter(pdf_path)
-            cv.convert(temp_docx_path, start=0, end=None)
-            cv.close()
+            if end is not None:
+                end = min(end, len(cv.fitz_doc))
+            try:
+                page_numbers = list(range(len(cv.fitz_doc)))[start:end]
+                advance = self._progress_counter(len(page_numbers), progress_callback)
+                if not image_pages:
+                    scan_pages = {}
+                elif include_images:
+                    scan_pages = dict.fromkeys(image_pages)
+                else:
+                    scan_pages = self._ocr_pages(pdf_path, sorted(image_pages), advance, cancel_check)
+                if scan_pages or progress_callback or cancel_check:
+                    self._convert_pages(cv, temp_docx_path, page_numbers, advance, cancel_check, scan_pages)
+                else:
+                    cv.convert(temp_docx_path, start=start, end=end)
+            finally:
+                cv.close()
             
             # Если нужно только текст без форматирования
             if not preserve_layout:
-                text = self.extract_text_only(pdf_path)
+                text = self.extract_text_only(pdf_path, start, end)
                 doc = Document()
                 doc.add_paragraph(text)
                 doc.save(output_path)
                 os.unlink(temp_docx_path)
             else:
+                # Уменьшаем, пережимаем или убираем изображения, чтобы
+                # результат уложился в лимит отправки
+                policy = 'drop' if not include_images else (image_policy or DOCX_IMAGE_SETTINGS['policy'])
+                self._limit_docx_images(temp_docx_path, policy)
+                
                 # Перемещаем временный файл в финальное место
-                os.rename(temp_docx_path, output_path)
+                os.replace(temp_docx_path, output_path)
             
             return True
             
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            if temp_docx_path:
+                self.cleanup_temp_files(temp_docx_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка конвертации в Word: {e}")
             return False
     
-    def extract_tables_to_excel(self, pdf_path: str, output_path: str) -> bool:
+    @staticmethod
+    def _is_image_page(page) -> bool:
+        """Страница-скан: без текстового слоя и почти целиком занята изображениями"""
+        import fitz
+        if len(page.get_text('text').strip()) >= SCAN_SETTINGS['min_text_chars']:
+            return False
+        area = abs(page.rect)
+        if not area:
+            return False
+        covered = sum(abs(fitz.Rect(image['bbox']) & page.rect) for image in page.get_image_info())
+        return covered / area >= SCAN_SETTINGS['min_image_coverage']
+    
+    def _classify_pages(self, pdf_path: str, start: int = 0, end: Optional[int] = None,
+                        scan_page_numbers: Optional[List[int]] = None) -> Tuple[List[int], Set[int]]:
+        """Номера страниц диапазона и номера страниц-сканов среди них.
+
+        Уже известные сканы (scan_page_numbers) повторно не определяются.
+        """
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            page_numbers = list(range(len(doc)))[start:end]
+            if scan_page_numbers is not None:
+                return page_numbers, set(scan_page_numbers) & set(page_numbers)
+            image_pages = {number for number in page_numbers if self._is_image_page(doc[number])}
+        return page_numbers, image_pages
+    
+    @staticmethod
+    def _progress_counter(total: int, progress_callback: Optional[ProgressCallback]) -> Callable[[], None]:
+        """Счетчик обработанных страниц, сообщающий прогресс"""
+        done = 0
+        
+        def advance():
+            nonlocal done
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+        
+        return advance
+    
+    def ocr_available(self) -> bool:
+        """Локальное распознавание включено и установлено (pytesseract и tesseract)"""
+        return (SCAN_SETTINGS['ocr_enabled'] and
+                importlib.util.find_spec('pytesseract') is not None and
+                shutil.which('tesseract') is not None)
+    
+    def _ocr_if_available(self, pdf_path: str, image_pages: Set[int],
+                          on_page: Optional[Callable[[], None]] = None,
+                          cancel_check: Optional[CancelCheck] = None) -> Dict[int, str]:
+        """Распознает страницы-сканы, если OCR доступен"""
+        if not image_pages or not self.ocr_available():
+            return {}
+        return self._ocr_pages(pdf_path, sorted(image_pages), on_page, cancel_check)
+    
+    def _ocr_pages(self, pdf_path: str, page_numbers: List[int],
+                   on_page: Optional[Callable[[], None]] = None,
+                   cancel_check: Optional[CancelCheck] = None) -> Dict[int, str]:
+        """Распознает текст страниц tesseract'ом параллельно.
+
+        Страницы рендерятся в текущем потоке (PyMuPDF не потокобезопасен),
+        а tesseract запускается из пула потоков отдельными процессами.
+        В работе не больше 2 * ocr_threads страниц, чтобы ограничить память.
+        """
+        import fitz
+        import pytesseract
+        from PIL import Image
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        threads = max(1, SCAN_SETTINGS['ocr_threads'])
+        results = {}
+        pending = {}
+        
+        def collect():
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                page_number = pending.pop(future)
+                try:
+                    results[page_number] = future.result().strip()
+                except Exception as e:
+                    logger.error(f"Ошибка распознавания страницы {page_number + 1}: {e}")
+                    results[page_number] = ""
+                if on_page:
+                    on_page()
+        
+        with fitz.open(pdf_path) as doc, ThreadPoolExecutor(threads) as executor:
+            for page_number in page_numbers:
+                self._checkpoint(cancel_check)
+                while len(pending) >= threads * 2:
+                    collect()
+                pix = doc[page_number].get_pixmap(dpi=SCAN_SETTINGS['ocr_dpi'], colorspace=fitz.csGRAY)
+                image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+                future = executor.submit(pytesseract.image_to_string, image,
+                                         lang=SCAN_SETTINGS['ocr_languages'])
+                pending[future] = page_number
+            while pending:
+                collect()
+        return results
+    
+    def _images_to_docx(self, pdf_path: str, docx_path: str, page_numbers: List[int],
+                        progress_callback: Optional[ProgressCallback] = None,
+                        cancel_check: Optional[CancelCheck] = None):
+        """Собирает DOCX из изображений страниц - быстрый путь для сканов"""
+        import fitz
+        from docx import Document
+        
+        document = Document()
+        with fitz.open(pdf_path) as doc:
+            for done, page_number in enumerate(page_numbers, 1):
+                self._checkpoint(cancel_check)
+                self._add_scan_page(document, doc[page_number])
+                if progress_callback:
+                    progress_callback(done, len(page_numbers))
+        document.save(docx_path)
+    
+    @staticmethod
+    def _add_scan_page(document, page, text: Optional[str] = None):
+        """Добавляет в DOCX страницу-скан отдельным разделом с размером листа из PDF.
+
+        Без text страница вставляется изображением во весь лист, иначе -
+        распознанным текстом с обычными полями.
+        """
+        from docx.shared import Pt
+        
+        width, height = page.rect.width, page.rect.height
+        # Первая страница занимает раздел по умолчанию, как в pdf2docx
+        section = document.add_section() if document.paragraphs else document.sections[0]
+        section.page_width, section.page_height = Pt(width), Pt(height)
+        
+        if text is not None:
+            section.left_margin = section.right_margin = Pt(56)
+            section.top_margin = section.bottom_margin = Pt(56)
+            for paragraph in text.split('\n\n'):
+                document.add_paragraph(paragraph.strip())
+            return
+        
+        section.left_margin = section.right_margin = Pt(0)
+        section.top_margin = section.bottom_margin = Pt(0)
+        pix = page.get_pixmap(dpi=DOCX_IMAGE_SETTINGS['target_dpi'])
+        image = io.BytesIO(pix.pil_tobytes(format='JPEG', quality=DOCX_IMAGE_SETTINGS['jpeg_quality']))
+        # Чуть меньше листа, чтобы Word не перенес изображение на новую страницу
+        document.add_picture(image, width=Pt(width * 0.97), height=Pt(height * 0.97))
+    
+    def _convert_pages(self, cv, docx_path: str, page_numbers: List[int],
+                       on_page: Optional[Callable[[], None]] = None,
+                       cancel_check: Optional[CancelCheck] = None,
+                       scan_pages: Optional[Dict[int, Optional[str]]] = None):
+        """Повторяет Converter.convert из pdf2docx с собственным циклом по страницам.
+
+        Разбор страниц - самая долгая часть конвертации, поэтому прогресс
+        сообщается, а отмена проверяется после каждой разобранной страницы.
+        Страницы scan_pages pdf2docx не разбирает: они встают на свое место
+        в документе изображением (None) или распознанным текстом.
+        """
+        from docx import Document
+        
+        scan_pages = scan_pages or {}
+        settings = cv.default_settings
+        settings['multi_processing'] = False
+        text_pages = [number for number in page_numbers if number not in scan_pages]
+        if text_pages:
+            cv.load_pages(pages=text_pages).parse_document(**settings)
+            for page in cv.pages:
+                if page.skip_parsing:
+                    continue
+                self._checkpoint(cancel_check)
+                try:
+                    page.parse(**settings)
+                except Exception as e:
+                    if settings['debug'] or not settings['ignore_page_error']:
+                        raise
+                    logger.error(f"Пропущена страница {page.id + 1} из-за ошибки разбора: {e}")
+                if on_page:
+                    on_page()
+        
+        # Собираем документ сами (как Converter.make_docx), чтобы вставить
+        # страницы-сканы между разобранными страницами
+        document = Document()
+        for number in page_numbers:
+            self._checkpoint(cancel_check)
+            if number in scan_pages:
+                self._add_scan_page(document, cv.fitz_doc[number], scan_pages[number])
+                if scan_pages[number] is None and on_page:
+                    # Распознанные страницы уже учтены в прогрессе OCR
+                    on_page()
+                continue
+            page = cv.pages[number]
+            if not page.finalized:
+                continue
+            try:
+                page.make_docx(document)
+            except Exception as e:
+                if settings['debug'] or not settings['ignore_page_error']:
+                    raise
+                logger.error(f"Пропущена страница {number + 1} из-за ошибки создания: {e}")
+        document.save(docx_path)
+    
+    def _limit_docx_images(self, docx_path: str, policy: str):
+        """Применяет политику изображений и ужесточает ее, пока DOCX больше лимита"""
+        if policy not in IMAGE_POLICIES:
+            logger.warning(f"Неизвестная политика изображений: {policy}")
+            policy = 'original'
+        
+        for current in IMAGE_POLICIES[IMAGE_POLICIES.index(policy):]:
+            if current != 'original':
+                self._apply_image_policy(docx_path, current)
+            size = os.path.getsize(docx_path)
+            if size <= DOCX_IMAGE_SETTINGS['max_output_size']:
+                return
+            logger.info(f"DOCX {size / (1024 * 1024):.1f}MB больше лимита после политики {current}")
+    
+    def _apply_image_policy(self, docx_path: str, policy: str):
+        """Уменьшает, пережимает в JPEG или убирает изображения DOCX"""
+        from docx import Document
+        from docx.oxml.ns import qn
+        from docx.opc.packuri import PackURI
+        try:
+            doc = Document(docx_path)
+            part = doc.part
+            
+            if policy == 'drop':
+                rel_ids = set()
+                for drawing in part.element.xpath('//w:drawing'):
+                    rel_ids.update(blip.get(qn('r:embed')) for blip in drawing.xpath('.//a:blip'))
+                    drawing.getparent().remove(drawing)
+                for rel_id in rel_ids:
+                    part.drop_rel(rel_id)
+                doc.save(docx_path)
+                return
+            
+            # Наибольший размер, в котором каждое изображение выводится на странице (дюймы)
+            display_sizes = {}
+            for shape in part.element.xpath('//wp:inline | //wp:anchor'):
+                extent = shape.find(qn('wp:extent'))
+                blips = shape.xpath('.//a:blip')
+                if extent is None or not blips:
+                    continue
+                rel_id = blips[0].get(qn('r:embed'))
+                width = int(extent.get('cx')) / EMU_PER_INCH
+                height = int(extent.get('cy')) / EMU_PER_INCH
+                old_width, old_height = display_sizes.get(rel_id, (0, 0))
+                display_sizes[rel_id] = (max(width, old_width), max(height, old_height))
+            
+            partnames = {str(p.partname) for p in part.package.iter_parts()}
+            changed = False
+            for rel_id, (width, height) in display_sizes.items():
+                image_part = part.related_parts.get(rel_id)
+                if image_part is None:
+                    continue
+                try:
+                    blob = self._recompress_image(image_part.blob, width, height, policy == 'jpeg')
+                except MemoryError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Изображение {image_part.partname} оставлено как есть: {e}")
+                    continue
+                if blob is None:
+                    continue
+                
+                # python-docx не дает заменить содержимое изображения через публичный API
+                image_part._blob = blob
+                changed = True
+                if policy == 'jpeg' and image_part.partname.ext not in ('jpg', 'jpeg'):
+                    # Данные уже в JPEG, поэтому имя и тип меняются всегда:
+                    # занятое имя получает номер
+                    base = str(image_part.partname)[:-len(image_part.partname.ext) - 1]
+                    name = f"{base}.jpeg"
+                    counter = 1
+                    while name in partnames:
+                        counter += 1
+                        name = f"{base}_{counter}.jpeg"
+                    partnames.discard(str(image_part.partname))
+                    partnames.add(name)
+                    image_part.partname = PackURI(name)
+                    image_part._content_type = 'image/jpeg'
+            
+            if changed:
+                doc.save(docx_path)
+        
+        except MemoryError:
+            raise
+        except Exception as e:
+            # Документ остается с исходными изображениями
+            logger.error(f"Ошибка обработки изображений DOCX ({policy}): {e}")
+    
+    @staticmethod
+    def _recompress_image(blob: bytes, width_in: float, height_in: float, to_jpeg: bool) -> Optional[bytes]:
+        """Уменьшает изображение до target_dpi при выводе размером width_in x height_in.
+
+        Возвращает новые данные или None, если изображение не стало меньше.
+        """
+        from PIL import Image
+        dpi = DOCX_IMAGE_SETTINGS['target_dpi']
+        with Image.open(io.BytesIO(blob)) as image:
+            image.load()
+            image_format = image.format or 'PNG'
+            scale = min(1.0, width_in * dpi / image.width, height_in * dpi / image.height)
+            # Уменьшение меньше чем на 10% не окупает перекодирование
+            if scale > 0.9 and not to_jpeg:
+                return None
+            if scale <= 0.9:
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image = image.resize(size, Image.LANCZOS)
+            
+            output = io.BytesIO()
+            if to_jpeg:
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    # JPEG не хранит прозрачность - кладем изображение на белый фон
+                    image = image.convert('RGBA')
+                    background = Image.new('RGB', image.size, 'white')
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                elif image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(output, 'JPEG', quality=DOCX_IMAGE_SETTINGS['jpeg_quality'], optimize=True)
+            else:
+                image.save(output, image_format, optimize=True)
+        
+        data = output.getvalue()
+        return data if len(data) < len(blob) else None
+    
+    def _page_tables(self, page, page_num: int) -> list:
+        """Извлекает таблицы страницы pdfplumber в DataFrame"""
+        frames = []
+        for table_num, table in enumerate(page.extract_tables(), 1):
+            if table:
+                df = self._normalize_table(table)
+                if df is None:
+                    continue
+                df['Страница'] = page_num
+                df['Таблица'] = table_num
+                frames.append(df)
+        return frames
+    
+    @staticmethod
+    def _clean_cells(column):
+        """Склеивает многострочные ячейки и убирает пробелы по краям; пустые - в None"""
+        cleaned = column.str.replace(r'\s*\n\s*', ' ', regex=True).str.strip()
+        return cleaned.mask(cleaned == '')
+    
+    @classmethod
+    def _normalize_table(cls, table: list):
+        """Приводит сырую таблицу pdfplumber к DataFrame с уникальными заголовками и типами.
+
+        Ячейки очищаются по столбцам целиком, пустые строки и безымянные
+        пустые столбцы удаляются, числа (в том числе с десятичной запятой)
+        и даты получают свои типы. Возвращает None для пустой таблицы.
+        """
+        import pandas as pd
+        width = max(len(row) for row in table)
+        raw = pd.DataFrame(table, columns=range(width), dtype=object)
+        for column in raw.columns:
+            raw[column] = cls._clean_cells(raw[column].astype('string'))
+        
+        # Заголовки: пустые получают имя по номеру, повторы - суффикс.
+        # Сгенерированное имя может совпасть с настоящим заголовком
+        # (['A', 'A', 'A_2']), поэтому суффикс растет до свободного имени
+        headers = []
+        seen = set()
+        for index, header in enumerate(raw.iloc[0]):
+            base = header if isinstance(header, str) else f"Столбец_{index + 1}"
+            name, suffix = base, 1
+            while name in seen:
+                suffix += 1
+                name = f"{base}_{suffix}"
+            seen.add(name)
+            headers.append(name)
+        
+        df = raw.iloc[1:].dropna(how='all')
+        df.columns = headers
+        # Столбцы без заголовка и без данных - артефакт объединенных ячеек
+        unnamed_empty = [name for index, name in enumerate(headers)
+                         if not isinstance(raw.iat[0, index], str) and df[name].isna().all()]
+        df = df.drop(columns=unnamed_empty).reset_index(drop=True)
+        if df.columns.empty:
+            return None
+        
+        for column in df.columns:
+            df[column] = cls._infer_column(df[column])
+        return df
+    
+    @staticmethod
+    def _infer_column(column):
+        """Определяет тип столбца: целые, дробные числа, даты или текст"""
+        import pandas as pd
+        values = column.dropna()
+        if values.empty:
+            return column.astype(object)
+        
+        # Числа: разделители разрядов и десятичный знак определяются
+        # для каждого значения (TABLE_NUMBER_PATTERN), минус U+2212
+        parts = values.str.replace('\u2212', '-', regex=False).str.extract(TABLE_NUMBER_PATTERN)
+        digits = parts['int'].str.replace(r'[ \u00a0\u202f.,]', '', regex=True)
+        compact = digits.where(parts['frac'].isna(), digits + '.' + parts['frac'])
+        # Коды с ведущими нулями и длинные номера (ИНН, счета) оставляем текстом
+        is_code = digits.str.match(r'^-?0\d') | (compact.str.count(r'\d') > 15)
+        numbers = pd.to_numeric(compact.astype(object), errors='coerce')
+        if not is_code.any() and numbers.notna().all():
+            numbers = numbers.reindex(column.index)
+            if (numbers.dropna() % 1 == 0).all():
+                return numbers.astype('Int64')
+            return numbers.astype('float64')
+        
+        for date_format in TABLE_DATE_FORMATS:
+            dates = pd.to_datetime(values, format=date_format, errors='coerce')
+            if dates.notna().all():
+                return dates.reindex(column.index)
+        
+        return column.astype(object).where(column.notna(), None)
+    
+    def _save_tables_to_excel(self, all_tables: list, output_path: str, text: str):
+        """Сохраняет таблицы в Excel; если таблиц нет - сохраняет текст"""
+        import pandas as pd
+        if all_tables:
+            # Объединяем все таблицы
+            combined_df = pd.concat(all_tables, ignore_index=True)
+            
+            # Сохраняем в Excel с несколькими листами
+            # Номера столбцов с датами (1-based, как в openpyxl)
+            date_columns = [index for index, dtype in enumerate(combined_df.dtypes, 1)
+                            if pd.api.types.is_datetime64_any_dtype(dtype)]
+            
+            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+                combined_df.to_excel(writer, sheet_name='Все_таблицы', index=False)
+                self._format_date_columns(writer.sheets['Все_таблицы'], date_columns)
+                
+                # Создаем отдельные листы для каждой страницы
+                for page_num in combined_df['Страница'].unique():
+                    page_data = combined_df[combined_df['Страница'] == page_num]
+                    sheet_name = f'Страница_{int(page_num)}'
+                    page_data.to_excel(writer, sheet_name=sheet_name, index=False)
+                    self._format_date_columns(writer.sheets[sheet_name], date_columns)
+        else:
+            # Если таблиц нет, создаем Excel с текстом
+            df = pd.DataFrame({'Текст': [text]})
+            df.to_excel(output_path, index=False)
+    
+    @staticmethod
+    def _format_date_columns(sheet, columns: List[int]):
+        """Показывает даты без времени: pandas с openpyxl пишет их как дату и время"""
+        for column in columns:
+            for (cell,) in sheet.iter_rows(min_row=2, min_col=column, max_col=column):
+                cell.number_format = 'DD.MM.YYYY'
+    
+    def extract_tables_to_excel(self, pdf_path: str, output_path: str,
+                                start: int = 0, end: Optional[int] = None,
+                                progress_callback: Optional[ProgressCallback] = None,
+                                cancel_check: Optional[CancelCheck] = None) -> bool:
         """Извлекает таблицы из PDF и сохраняет в Excel"""
+        import pdfplumber
         try:
             all_tables = []
             
+            # На страницах-сканах таблиц в текстовом слое нет - пропускаем их
+            page_numbers, image_pages = self._classify_pages(pdf_path, start, end)
             with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    tables = page.extract_tables()
-                    
-                    for table_num, table in enumerate(tables, 1):
-                        if table:
-                            # Создаем DataFrame для каждой таблицы
-                            df = pd.DataFrame(table[1:], columns=table[0])
-                            df['Страница'] = page_num
-                            df['Таблица'] = table_num
-                            all_tables.append(df)
-            
-            if all_tables:
-                # Объединяем все таблицы
-                combined_df = pd.concat(all_tables, ignore_index=True)
+                for done, page_number in enumerate(page_numbers, 1):
+                    self._checkpoint(cancel_check)
+                    if page_number not in image_pages:
+                        all_tables.extend(self._page_tables(pdf.pages[page_number], page_number + 1))
+                    if progress_callback:
+                        progress_callback(done, len(page_numbers))
+            
+            text = "" if all_tables else self.extract_text_only(pdf_path, start, end)
+            self._save_tables_to_excel(all_tables, output_path, text)
+            return True
                 
-                # Сохраняем в Excel с несколькими листами
-                with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                    combined_df.to_excel(writer, sheet_name='Все_таблицы', index=False)
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка извлечения таблиц: {e}")
+            return False
+    
+    def _iter_tables(self, pdf_path: str, start: int = 0, end: Optional[int] = None,
+                     progress_callback: Optional[ProgressCallback] = None,
+                     cancel_check: Optional[CancelCheck] = None) -> Iterator[Tuple[int, int, list]]:
+        """Перебирает таблицы по мере извлечения: (страница, номер таблицы, строки)"""
+        import pdfplumber
+        page_numbers, image_pages = self._classify_pages(pdf_path, start, end)
+        with pdfplumber.open(pdf_path) as pdf:
+            for done, page_number in enumerate(page_numbers, 1):
+                self._checkpoint(cancel_check)
+                if page_number not in image_pages:
+                    for table_num, table in enumerate(pdf.pages[page_number].extract_tables(), 1):
+                        if table:
+                            yield page_number + 1, table_num, table
+                if progress_callback:
+                    progress_callback(done, len(page_numbers))
+    
+    def extract_tables_to_csv_zip(self, pdf_path: str, output_path: str,
+                                  start: int = 0, end: Optional[int] = None,
+                                  progress_callback: Optional[ProgressCallback] = None,
+                                  cancel_check: Optional[CancelCheck] = None) -> int:
+        """Сохраняет каждую таблицу отдельным CSV в ZIP-архив.
+
+        Таблицы пишутся в архив сразу по мере извлечения, без pandas и
+        Excel. Возвращает число таблиц (0 - таблиц нет или ошибка).
+        """
+        count = 0
+        try:
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for page_num, table_num, table in self._iter_tables(
+                        pdf_path, start, end, progress_callback, cancel_check):
+                    with archive.open(f"page{page_num:03d}_table{table_num}.csv", 'w') as entry:
+                        # BOM, чтобы Excel открыл UTF-8 без вопросов
+                        with io.TextIOWrapper(entry, encoding='utf-8-sig', newline='') as text:
+                            csv.writer(text).writerows(table)
+                    count += 1
+            if not count:
+                self.cleanup_temp_files(output_path)
+            return count
+        
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            self.cleanup_temp_files(output_path)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка экспорта таблиц в CSV: {e}")
+            self.cleanup_temp_files(output_path)
+            return 0
+    
+    @staticmethod
+    def parquet_available() -> bool:
+        """Установлен ли pyarrow для экспорта в Parquet"""
+        return importlib.util.find_spec('pyarrow') is not None
+    
+    def extract_tables_to_parquet(self, pdf_path: str, output_path: str,
+                                  start: int = 0, end: Optional[int] = None,
+                                  progress_callback: Optional[ProgressCallback] = None,
+                                  cancel_check: Optional[CancelCheck] = None,
+                                  row_group_size: int = 50000) -> int:
+        """Сохраняет все таблицы в один Parquet-файл в длинном формате.
+
+        Колонки: page, table, row, column, header, value - по строке на
+        ячейку, так таблицы с разной структурой помещаются в одну схему.
+        Данные сбрасываются группами строк по мере извлечения.
+        Возвращает число таблиц (0 - таблиц нет или ошибка).
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        schema = pa.schema([
+            ('page', pa.int32()), ('table', pa.int32()), ('row', pa.int32()),
+            ('column', pa.int32()), ('header', pa.string()), ('value', pa.string())
+        ])
+        columns = {name: [] for name in schema.names}
+        count = 0
+        writer = None
+        
+        def flush():
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            for values in columns.values():
+                values.clear()
+        
+        try:
+            writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+            for page_num, table_num, table in self._iter_tables(
+                    pdf_path, start, end, progress_callback, cancel_check):
+                header = table[0]
+                for row_num, row in enumerate(table[1:], 1):
+                    for col_num, value in enumerate(row, 1):
+                        columns['page'].append(page_num)
+                        columns['table'].append(table_num)
+                        columns['row'].append(row_num)
+                        columns['column'].append(col_num)
+                        columns['header'].append(header[col_num - 1] if col_num <= len(header) else None)
+                        columns['value'].append(value)
+                count += 1
+                if len(columns['value']) >= row_group_size:
+                    flush()
+            if columns['value']:
+                flush()
+            writer.close()
+            if not count:
+                self.cleanup_temp_files(output_path)
+            return count
+        
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            if writer:
+                writer.close()
+            self.cleanup_temp_files(output_path)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка экспорта таблиц в Parquet: {e}")
+            if writer:
+                writer.close()
+            self.cleanup_temp_files(output_path)
+            return 0
+    
+    def extract_text_and_tables(self, pdf_path: str, text_path: str, excel_path: str,
+                                start: int = 0, end: Optional[int] = None,
+                                progress_callback: Optional[ProgressCallback] = None,
+                                cancel_check: Optional[CancelCheck] = None,
+                                scan_page_numbers: Optional[List[int]] = None) -> bool:
+        """Извлекает текст и таблицы за один проход по страницам.
+
+        Каждая страница разбирается pdfplumber один раз, а текст и таблицы
+        берутся из одних и тех же разобранных данных. scan_page_numbers -
+        страницы-сканы из get_preflight_info, как в convert_to_word.
+        """
+        import pdfplumber
+        try:
+            texts = []
+            all_tables = []
+            
+            page_numbers, image_pages = self._classify_pages(pdf_path, start, end, scan_page_numbers)
+            advance = self._progress_counter(len(page_numbers), progress_callback)
+            ocr_text = self._ocr_if_available(pdf_path, image_pages, advance, cancel_check)
+            with pdfplumber.open(pdf_path) as pdf:
+                for page_number in page_numbers:
+                    self._checkpoint(cancel_check)
+                    if page_number in image_pages:
+                        # Скан: текст только из OCR, таблиц в текстовом слое нет
+                        page_text = ocr_text.get(page_number)
+                        if page_number not in ocr_text:
+                            advance()
+                    else:
+                        page = pdf.pages[page_number]
+                        page_text = page.extract_text()
+                        all_tables.extend(self._page_tables(page, page_number + 1))
+                        advance()
+                    if page_text:
+                        texts.append(page_text)
+            
+            text = "\n\n".join(texts).strip()
+            with open(text_path, 'w', encoding='utf-8') as txt_file:
+                txt_file.write(text)
+            self._save_tables_to_excel(all_tables, excel_path, text)
+            return True
+        
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка извлечения текста и таблиц: {e}")
+            return False
+    
+    def render_pages(self, pdf_path: str, output_dir: str, image_format: str = 'png', dpi: int = 150,
+                     start: int = 0, end: Optional[int] = None,
+                     progress_callback: Optional[ProgressCallback] = None,
+                     cancel_check: Optional[CancelCheck] = None) -> List[str]:
+        """Рендерит страницы в изображения PNG, JPEG или WebP.
+
+        Возвращает пути к файлам page_<номер>.<расширение> в output_dir.
+        """
+        import fitz
+        paths = []
+        try:
+            extension = 'jpg' if image_format == 'jpeg' else image_format
+            with fitz.open(pdf_path) as doc:
+                page_numbers = list(range(len(doc)))[start:end]
+                digits = len(str(len(doc)))
+                for done, page_number in enumerate(page_numbers, 1):
+                    self._checkpoint(cancel_check)
+                    page = doc[page_number]
+                    
+                    # Огромные страницы рендерим с меньшим DPI, чтобы не упереться в память
+                    page_dpi = dpi
+                    pixels = abs(page.rect) * (dpi / 72) ** 2
+                    if pixels > IMAGE_EXPORT_SETTINGS['max_pixels']:
+                        page_dpi = int(dpi * (IMAGE_EXPORT_SETTINGS['max_pixels'] / pixels) ** 0.5)
+                    
+                    pix = page.get_pixmap(dpi=page_dpi)
+                    path = os.path.join(output_dir, f"page_{page_number + 1:0{digits}d}.{extension}")
+                    if image_format == 'png':
+                        pix.save(path)
+                    else:
+                        pix.pil_save(path, format=image_format.upper(), quality=IMAGE_EXPORT_SETTINGS['quality'])
+                    paths.append(path)
                     
-                    # Создаем отдельные листы для каждой страницы
-                    for page_num in combined_df['Страница'].unique():
-                        page_data = combined_df[combined_df['Страница'] == page_num]
-                        sheet_name = f'Страница_{int(page_num)}'
-                        page_data.to_excel(writer, sheet_name=sheet_name, index=False)
+                    if progress_callback:
+                        progress_callback(done, len(page_numbers))
+            return paths
+        
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            self.cleanup_temp_files(*paths)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рендера страниц: {e}")
+            self.cleanup_temp_files(*paths)
+            return []
+    
+    def render_thumbnail(self, pdf_path: str, max_size: int = 320) -> Optional[bytes]:
+        """Быстрое превью первой страницы (JPEG)"""
+        import fitz
+        try:
+            with fitz.open(pdf_path) as doc:
+                page = doc[0]
+                zoom = max_size / max(page.rect.width, page.rect.height)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                return pix.pil_tobytes(format='JPEG', quality=IMAGE_EXPORT_SETTINGS['quality'])
+        except Exception as e:
+            logger.error(f"Ошибка создания превью: {e}")
+            return None
+    
+    def compress_pdf(self, pdf_path: str, output_path: str,
+                     start: int = 0, end: Optional[int] = None,
+                     progress_callback: Optional[ProgressCallback] = None,
+                     cancel_check: Optional[CancelCheck] = None) -> int:
+        """Сжимает PDF: уменьшает изображения, урезает шрифты, чистит и сжимает потоки.
+
+        Исходным документом для диапазона страниц считаются выбранные
+        страницы без сжатия. Если сжатый файл не меньше исходного,
+        сохраняется исходный. Возвращает размер исходного документа
+        в байтах или 0 при ошибке.
+        """
+        import fitz
+        baseline_path = None
+        try:
+            with fitz.open(pdf_path) as doc:
+                page_numbers = list(range(len(doc)))[start:end]
+                if len(page_numbers) < len(doc):
+                    doc.select(page_numbers)
+                    # Выбранные страницы как есть: с ними сравнивается результат
+                    with tempfile.NamedTemporaryFile(suffix='.pdf', dir=self.temp_dir, delete=False) as temp_file:
+                        baseline_path = temp_file.name
+                    with fitz.open(pdf_path) as original:
+                        original.select(page_numbers)
+                        original.save(baseline_path, garbage=3)
                 
-                return True
-            else:
-                # Если таблиц нет, создаем Excel с текстом
-                text = self.extract_text_only(pdf_path)
-                df = pd.DataFrame({'Текст': [text]})
-                df.to_excel(output_path, index=False)
-                return True
+                processed = set()
+                for done, page in enumerate(doc, 1):
+                    self._checkpoint(cancel_check)
+                    for image in page.get_images(full=True):
+                        xref, smask = image[0], image[1]
+                        # Изображения с маской прозрачности оставляем как есть
+                        if xref in processed or smask:
+                            continue
+                        processed.add(xref)
+                        self._downsample_pdf_image(doc, page, xref)
+                    if progress_callback:
+                        progress_callback(done, len(doc))
                 
+                self._checkpoint(cancel_check)
+                try:
+                    doc.subset_fonts()
+                except Exception as e:
+                    # Урезание шрифтов требует fontTools (requirements.txt);
+                    # без него шаг пропускается
+                    logger.warning(f"Шрифты не урезаны: {e}")
+                doc.save(output_path, garbage=4, deflate=True, clean=True)
+            
+            source_path = baseline_path or pdf_path
+            size_before = os.path.getsize(source_path)
+            if os.path.getsize(output_path) >= size_before:
+                shutil.copyfile(source_path, output_path)
+            return size_before
+        
+        except (MemoryError, ConversionCancelled):
+            # Пусть воркер пула сообщит о превышении лимита памяти или отмене
+            self.cleanup_temp_files(output_path)
+            raise
         except Exception as e:
-            logger.error(f"Ошибка извлечения таблиц: {e}")
-            return False
+            logger.error(f"Ошибка сжатия PDF: {e}")
+            self.cleanup_temp_files(output_path)
+            return 0
+        finally:
+            if baseline_path:
+                self.cleanup_temp_files(baseline_path)
+    
+    @staticmethod
+    def _downsample_pdf_image(doc, page, xref: int):
+        """Уменьшает изображение PDF до dpi при наибольшем размере на странице и пережимает в JPEG"""
+        import fitz
+        from PIL import Image
+        try:
+            original_size = len(doc.xref_stream_raw(xref) or b'')
+            if original_size < COMPRESS_SETTINGS['min_image_bytes']:
+                return
+            rects = page.get_image_rects(xref)
+            if not rects:
+                return
+            width_in = max(rect.width for rect in rects) / 72
+            height_in = max(rect.height for rect in rects) / 72
+            
+            pix = fitz.Pixmap(doc, xref)
+            if pix.alpha or pix.colorspace is None:
+                return
+            if pix.colorspace.n not in (1, 3):
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+            
+            dpi = COMPRESS_SETTINGS['dpi']
+            scale = min(1.0, width_in * dpi / pix.width, height_in * dpi / pix.height)
+            mode = 'L' if pix.n == 1 else 'RGB'
+            image = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+            if scale < 0.9:
+                image = image.resize(
+                    (max(1, round(pix.width * scale)), max(1, round(pix.height * scale))),
+                    Image.LANCZOS
+                )
+            
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=COMPRESS_SETTINGS['jpeg_quality'], optimize=True)
+            if output.tell() < original_size:
+                page.replace_image(xref, stream=output.getvalue())
+        except MemoryError:
+            raise
+        except Exception as e:
+            logger.warning(f"Изображение {xref} оставлено без изменений: {e}")
     
     def get_pdf_info(self, pdf_path: str) -> dict:
         """Получает информацию о PDF файле"""
+        import fitz
         try:
             with fitz.open(pdf_path) as doc:
                 info = {
@@ -151,6 +1030,41 @@ class PDFConverter:
             logger.error(f"Ошибка получения информации о PDF: {e}")
             return {}
     
+    def get_preflight_info(self, pdf_path: str, start: int = 0, end: Optional[int] = None) -> dict:
+        """Быстрый предварительный анализ PDF для оценки стоимости конвертации"""
+        import fitz
+        try:
+            with fitz.open(pdf_path) as doc:
+                images = 0
+                fonts = set()
+                text_pages = 0
+                scan_page_numbers = []
+                total_pages = len(doc)
+                page_numbers = range(total_pages)[start:end]
+                for page_number in page_numbers:
+                    page = doc[page_number]
+                    images += len(page.get_images(full=False))
+                    fonts.update(font[3] for font in page.get_fonts(full=False))
+                    if page.get_text('text').strip():
+                        text_pages += 1
+                    if self._is_image_page(page):
+                        scan_page_numbers.append(page_number)
+            return {
+                'pages': len(page_numbers),
+                'total_pages': total_pages,
+                'images': images,
+                'fonts': len(fonts),
+                'text_pages': text_pages,
+                'image_pages': len(scan_page_numbers),
+                # Номера страниц-сканов: конвертеры не классифицируют страницы повторно
+                'scan_page_numbers': scan_page_numbers,
+                'has_text_layer': text_pages > 0,
+                'size_mb': round(os.path.getsize(pdf_path) / (1024 * 1024), 2)
+            }
+        except Exception as e:
+            logger.error(f"Ошибка предварительного анализа PDF: {e}")
+            return {}
+    
     def cleanup_temp_files(self, *file_paths):
         """Удаляет временные файлы"""
         for file_path in file_paths:
@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from config import PIPELINE_SETTINGS, WORKER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Задача конвейера, которую обрабатывает текущая задача asyncio
+_current_job: contextvars.ContextVar[Optional['PipelineJob']] = contextvars.ContextVar(
+    'pipeline_job', default=None
+)
+
+class Stage:
+    """Этап конвейера обработки.
+
+    Одновременно выполняется не больше workers операций этапа, а всего
+    в этапе (выполняются или ждут слота) не больше workers + queue_size
+    задач. Задача, которой не хватило места, ждет на предыдущем этапе,
+    не освобождая его.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.active = 0
+        self.queued = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._places: Optional[asyncio.Semaphore] = None
+
+    def _ensure(self):
+        if self._slots is None:
+            # Семафоры создаются внутри работающего цикла событий
+            self._slots = asyncio.Semaphore(self.workers)
+            self._places = asyncio.Semaphore(self.capacity)
+
+    async def _acquire_place(self):
+        self._ensure()
+        await self._places.acquire()
+        self.queued += 1
+
+    def _release_place(self):
+        self.queued -= 1
+        self._places.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Выполняет операцию этапа: место в очереди этапа, затем рабочий слот.
+
+        Операция задачи конвейера переводит задачу на этот этап; прочие
+        операции занимают место только на время выполнения.
+        """
+        self._ensure()
+        job = _current_job.get()
+        queued_at = time.monotonic()
+        if job is None:
+            await self._acquire_place()
+        else:
+            await job.enter(self)
+        try:
+            async with self._slots:
+                self.active += 1
+                started = time.monotonic()
+                try:
+                    yield
+                finally:
+                    self.active -= 1
+                    if job is not None:
+                        job.account(self.name, started - queued_at, time.monotonic() - started)
+        finally:
+            if job is None:
+                self._release_place()
+
+class PipelineJob:
+    """Положение задачи в конвейере.
+
+    Задача держит место на этапе, пока не получит место на следующем,
+    поэтому переполненный этап (например, медленная отправка в Telegram)
+    останавливает прием новых задач предыдущими этапами, но не отнимает
+    у них рабочие слоты.
+    """
+
+    def __init__(self, pipeline: 'Pipeline'):
+        self.pipeline = pipeline
+        self.stage: Optional[Stage] = None
+        self._lock = asyncio.Lock()
+        # Секунды ожидания и работы по этапам (для трасс задач)
+        self.waits: Dict[str, float] = {}
+        self.busy: Dict[str, float] = {}
+
+    async def enter(self, stage: Stage):
+        """Переводит задачу на этап, дождавшись места в его очереди"""
+        async with self._lock:
+            if self.stage is stage:
+                return
+            order = self.pipeline.stages
+            if self.stage is not None and order.index(stage) < order.index(self.stage):
+                # Возврат на предыдущий этап (текст отправляется частями):
+                # сначала освобождаем место, иначе встречные переходы
+                # двух задач могут навсегда заблокировать друг друга
+                self.stage._release_place()
+                self.stage = None
+            await stage._acquire_place()
+            if self.stage is not None:
+                self.stage._release_place()
+            self.stage = stage
+
+    def account(self, stage_name: str, waited: float, worked: float):
+        """Учитывает время ожидания и выполнения операции этапа"""
+        self.waits[stage_name] = self.waits.get(stage_name, 0.0) + waited
+        self.busy[stage_name] = self.busy.get(stage_name, 0.0) + worked
+
+    def close(self):
+        """Освобождает место задачи в конвейере"""
+        if self.stage is not None:
+            self.stage._release_place()
+            self.stage = None
+
+class Pipeline:
+    """Конвейер скачивание -> конвертация -> отправка.
+
+    У каждого этапа свой лимит параллельности и ограниченная очередь,
+    поэтому сетевые операции и конвертация не конкурируют за одни слоты:
+    отправка готовых результатов идет одновременно со скачиванием и
+    конвертацией других задач.
+    """
+
+    def __init__(self,
+                 download_workers: int = PIPELINE_SETTINGS['download_workers'],
+                 convert_workers: int = WORKER_SETTINGS['workers'],
+                 upload_workers: int = PIPELINE_SETTINGS['upload_workers'],
+                 queue_size: int = PIPELINE_SETTINGS['queue_size']):
+        self.download = Stage('download', download_workers, queue_size)
+        self.convert = Stage('convert', convert_workers, queue_size)
+        self.upload = Stage('upload', upload_workers, queue_size)
+        self.stages = (self.download, self.convert, self.upload)
+
+    def track(self) -> PipelineJob:
+        """Начинает отслеживать задачу в текущей задаче asyncio.
+
+        Освобождать место нужно вызовом close у возвращенного объекта.
+        """
+        job = PipelineJob(self)
+        _current_job.set(job)
+        return job
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Занятые слоты и места в очереди по этапам"""
+        return {
+            stage.name: {'active': stage.active, 'queued': stage.queued}
+            for stage in self.stages
+        }
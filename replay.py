@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение трасс задач для планирования мощностей.
+
+Трассы, записанные ботом (TRACE_ENABLED=true), размножаются генератором
+тестового корпуса и прогоняются через модель пула воркеров конвертации.
+Результат - прогноз пропускной способности и p95 времени ответа для
+заданного числа воркеров и бюджета памяти.
+
+Пример:
+    python replay.py temp/traces.jsonl --workers 1,2,4 --memory 4096 --rate 30
+"""
+
+import argparse
+import heapq
+import logging
+import math
+import random
+from collections import Counter, deque
+from pathlib import Path
+from typing import List, Optional
+
+from config import WORKER_SETTINGS
+from tracing import CONVERTED_OUTCOMES, load_traces
+
+logger = logging.getLogger(__name__)
+
+def generate_corpus(traces: List[dict], count: int, rate: Optional[float] = None,
+                    jitter: float = 0.3, seed: int = 0) -> List[dict]:
+    """Генерирует тестовый корпус задач по распределению записанных трасс.
+
+    Задачи выбираются из трасс с возвращением, объем документа (страницы,
+    изображения и время этапов) масштабируется логнормальным множителем.
+    Интервалы между задачами берутся из трасс или, если задан rate
+    (задач в минуту), из пуассоновского потока.
+    """
+    rng = random.Random(seed)
+    samples = [trace for trace in traces
+               if trace.get('outcome') in CONVERTED_OUTCOMES and trace.get('stages', {}).get('convert')]
+    if not samples:
+        raise ValueError("В трассах нет задач, дошедших до конвертации")
+
+    timestamps = sorted(trace['ts'] for trace in traces if trace.get('ts'))
+    gaps = [b - a for a, b in zip(timestamps, timestamps[1:])]
+
+    corpus = []
+    arrival = 0.0
+    for index in range(count):
+        trace = rng.choice(samples)
+        scale = math.exp(rng.gauss(0, jitter)) if jitter else 1.0
+        stages = trace.get('stages', {})
+        corpus.append({
+            'id': index,
+            'type': trace['type'],
+            'arrival': arrival,
+            'pages': max(1, round((trace.get('pages') or 1) * scale)),
+            'scan_pages': round((trace.get('scan_pages') or 0) * scale),
+            'images': round((trace.get('images') or 0) * scale),
+            'tables': trace.get('tables'),
+            'download': stages.get('download', 0.0),
+            'convert': stages['convert'] * scale,
+            'upload': stages.get('upload', 0.0),
+            # Пиковая память определяется скорее самой тяжелой страницей,
+            # чем их числом, поэтому не масштабируется
+            'peak_rss_mb': trace.get('peak_rss_mb') or 0
+        })
+        if rate:
+            arrival += rng.expovariate(rate / 60)
+        elif gaps:
+            arrival += rng.choice(gaps)
+    return corpus
+
+def write_benchmark_pdfs(corpus: List[dict], output_dir: str, limit: Optional[int] = None) -> int:
+    """Создает PDF-файлы корпуса для замеров на реальном конвертере.
+
+    Страницы с текстом, изображениями и таблицами, сканы - страницы из
+    одного изображения во весь лист. Возвращает число созданных файлов.
+    """
+    import fitz
+
+    directory = Path(output_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for job in corpus[:limit]:
+        doc = fitz.open()
+        rng = random.Random(job['id'])
+        scan_pages = min(job['scan_pages'], job['pages'])
+        images_left = job['images']
+        for page_number in range(job['pages']):
+            page = doc.new_page()
+            if page_number < scan_pages:
+                pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 850, 1100), 0)
+                pix.set_rect(pix.irect, (rng.randrange(200, 256),))
+                page.insert_image(page.rect, pixmap=pix)
+                continue
+            # Латиница: встроенный шрифт Helvetica не содержит кириллицы
+            text = f"Page {page_number + 1}. " + "Lorem ipsum dolor sit amet. " * 40
+            page.insert_textbox(fitz.Rect(50, 50, 545, 300), text, fontsize=10)
+            if images_left > 0:
+                pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 300), 0)
+                pix.set_rect(pix.irect, tuple(rng.randrange(256) for _ in range(3)))
+                page.insert_image(fitz.Rect(50, 320, 250, 470), pixmap=pix)
+                images_left -= 1
+            if job.get('tables'):
+                # Таблица 4x5 из линий и текста в ячейках
+                for row in range(5):
+                    for column in range(4):
+                        cell = fitz.Rect(300 + column * 60, 500 + row * 20,
+                                         360 + column * 60, 520 + row * 20)
+                        page.draw_rect(cell, width=0.5)
+                        page.insert_text(cell.tl + (3, 14), f"{row * 4 + column},5", fontsize=8)
+        doc.save(str(directory / f"job_{job['id']:05d}.pdf"), garbage=3, deflate=True)
+        doc.close()
+        written += 1
+    return written
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def simulate(corpus: List[dict], workers: int, memory_budget_mb: float,
+             memory_limit_mb: float = 0, speed: float = 1.0) -> dict:
+    """Моделирует пул воркеров конвертации на корпусе задач.
+
+    Задачи встают в общую очередь (FIFO) после скачивания и занимают воркер,
+    когда он свободен и суммарная пиковая память выполняемых задач
+    укладывается в memory_budget_mb. Задача с пиковой памятью выше
+    memory_limit_mb (лимит воркера) падает, отработав свое время.
+    speed - во сколько раз целевой сервер быстрее записавшего трассы.
+    """
+    events = []     # (время, порядок, тип, задача)
+    order = 0
+    for job in corpus:
+        heapq.heappush(events, (job['arrival'] + job['download'], order, 'ready', job))
+        order += 1
+
+    waiting = deque()
+    free_workers = workers
+    memory_used = 0.0
+    busy_time = 0.0
+    latencies = []
+    outcomes = Counter()
+    now = 0.0
+    first_arrival = min((job['arrival'] for job in corpus), default=0.0)
+
+    def start_ready():
+        nonlocal free_workers, memory_used, busy_time, order
+        while waiting and free_workers:
+            job = waiting[0]
+            if memory_used and memory_used + job['peak_rss_mb'] > memory_budget_mb:
+                # Голова очереди ждет памяти, остальные не обгоняют ее
+                break
+            waiting.popleft()
+            free_workers -= 1
+            memory_used += job['peak_rss_mb']
+            duration = job['convert'] / speed
+            busy_time += duration
+            heapq.heappush(events, (now + duration, order, 'done', job))
+            order += 1
+
+    while events:
+        now, _, kind, job = heapq.heappop(events)
+        if kind == 'ready':
+            if job['peak_rss_mb'] > memory_budget_mb:
+                # Не поместится даже на пустом сервере
+                outcomes['memory'] += 1
+            else:
+                waiting.append(job)
+        else:
+            free_workers += 1
+            memory_used -= job['peak_rss_mb']
+            if memory_limit_mb and job['peak_rss_mb'] > memory_limit_mb:
+                outcomes['memory'] += 1
+            else:
+                outcomes['ok'] += 1
+                latencies.append(now + job['upload'] - job['arrival'])
+        start_ready()
+
+    makespan = max(now - first_arrival, 1e-9)
+    return {
+        'workers': workers,
+        'memory_budget_mb': memory_budget_mb,
+        'completed': outcomes['ok'],
+        'failed_memory': outcomes['memory'],
+        'throughput_per_min': outcomes['ok'] / makespan * 60,
+        'p50_latency': percentile(latencies, 50),
+        'p95_latency': percentile(latencies, 95),
+        'utilization': busy_time / (makespan * workers)
+    }
+
+def main():
+    """Точка входа: прогноз по трассам для нескольких размеров пула"""
+    parser = argparse.ArgumentParser(description="Прогноз пропускной способности по трассам задач")
+    parser.add_argument('traces', help="Файл трасс (JSONL)")
+    parser.add_argument('--workers', default=str(WORKER_SETTINGS['workers']),
+                        help="Число воркеров, через запятую: 1,2,4")
+    parser.add_argument('--memory', type=float,
+                        default=WORKER_SETTINGS['workers'] * WORKER_SETTINGS['memory_limit_mb'],
+                        help="Бюджет памяти на все воркеры (MB)")
+    parser.add_argument('--memory-limit', type=float, default=WORKER_SETTINGS['memory_limit_mb'],
+                        help="Лимит памяти одного воркера (MB)")
+    parser.add_argument('--count', type=int, default=1000, help="Задач в корпусе")
+    parser.add_argument('--rate', type=float, help="Поток задач в минуту (по умолчанию - как в трассах)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Во сколько раз целевой сервер быстрее записавшего трассы")
+    parser.add_argument('--jitter', type=float, default=0.3, help="Разброс объема документов")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pdf-dir', help="Сохранить корпус как PDF-файлы для замеров")
+    parser.add_argument('--pdf-limit', type=int, default=50, help="Сколько PDF-файлов создать")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s - %(message)s', level=logging.INFO)
+
+    traces = load_traces(args.traces)
+    corpus = generate_corpus(traces, args.count, args.rate, args.jitter, args.seed)
+    types = Counter(job['type'] for job in corpus)
+    print(f"📊 Трасс: {len(traces)}, задач в корпусе: {len(corpus)}")
+    print("   " + ", ".join(f"{name}: {count}" for name, count in types.most_common()))
+
+    if args.pdf_dir:
+        written = write_benchmark_pdfs(corpus, args.pdf_dir, args.pdf_limit)
+        print(f"📁 Создано PDF-файлов: {written} в {args.pdf_dir}")
+
+    print()
+    print(f"{'Воркеры':>8} {'Задач/мин':>10} {'p50, с':>8} {'p95, с':>8} {'Загрузка':>9} {'Нехватка памяти':>16}")
+    for workers in (int(value) for value in args.workers.split(',')):
+        result = simulate(corpus, workers, args.memory, args.memory_limit, args.speed)
+        print(f"{workers:>8} {result['throughput_per_min']:>10.1f} "
+              f"{result['p50_latency']:>8.1f} {result['p95_latency']:>8.1f} "
+              f"{result['utilization']:>8.0%} {result['failed_memory']:>16}")
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,14 @@
 
 import os
 import sys
+import time
 import logging
+import importlib.util
 from pathlib import Path
 
+# Точка отсчета для метрик холодного старта
+STARTED = time.monotonic()
+
 # Добавляем текущую директорию в путь Python
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -33,22 +38,26 @@ def check_requirements():
     return True
 
 def check_dependencies():
-    """Проверяет установленные зависимости"""
-    try:
-        import telegram
-        import pdf2docx
-        import pdfplumber
-        import pandas
-        import openpyxl
-        import docx
-        import fitz
-        from dotenv import load_dotenv
-        print("✅ Все зависимости установлены")
-        return True
-    except ImportError as e:
-        print(f"❌ Отсутствует зависимость: {e}")
+    """Проверяет установленные зависимости без их импорта"""
+    modules = {
+        'telegram': 'python-telegram-bot',
+        'pdf2docx': 'pdf2docx',
+        'pdfplumber': 'pdfplumber',
+        'pandas': 'pandas',
+        'openpyxl': 'openpyxl',
+        'docx': 'python-docx',
+        'fitz': 'pymupdf',
+        'PIL': 'Pillow',
+        'dotenv': 'python-dotenv'
+    }
+    missing = [package for module, package in modules.items() if importlib.util.find_spec(module) is None]
+    if missing:
+        print(f"❌ Отсутствуют зависимости: {', '.join(missing)}")
         print("Установите зависимости командой: pip install -r requirements.txt")
         return False
+    
+    print("✅ Все зависимости установлены")
+    return True
 
 def main():
     """Основная функция"""
@@ -73,7 +82,7 @@ def main():
         print("Добавьте BOT_TOKEN в файл .env")
         sys.exit(1)
     
-    print("✅ Конфигурация проверена")
+    print(f"✅ Конфигурация проверена за {time.monotonic() - STARTED:.2f} сек")
     print("🚀 Запускаем бота...")
     print("Нажмите Ctrl+C для остановки")
     print("=" * 40)
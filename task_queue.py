@@ -0,0 +1,210 @@
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from config import QUEUE_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+class ConversionQueue:
+    """Долговременная очередь задач конвертации на SQLite.
+
+    Воркер берет задачу в аренду (lease) на ограниченное время и продлевает
+    ее, пока работает. Если воркер упал или был перезапущен, аренда истекает
+    и задачу забирает другой воркер. Неудачные задачи повторяются до
+    max_attempts раз. Отмененная пользователем задача получает статус
+    'cancelled': ожидающую больше не возьмут, а выполняющую воркер
+    останавливает сам, заметив отмену.
+    """
+
+    def __init__(self, db_path: str,
+                 lease_seconds: int = QUEUE_SETTINGS['lease_seconds'],
+                 max_attempts: int = QUEUE_SETTINGS['max_attempts'],
+                 retry_delay: int = QUEUE_SETTINGS['retry_delay']):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """Открывает соединение с базой (по одному на операцию)"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """Создает таблицу задач"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_expires REAL,
+                    worker_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, available_at)"
+            )
+
+    def enqueue(self, payload: Dict[str, Any]) -> int:
+        """Ставит задачу в очередь и возвращает ее id"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (payload, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (json.dumps(payload, ensure_ascii=False), now, now, now)
+            )
+            job_id = cursor.lastrowid
+        logger.info(f"Задача {job_id} поставлена в очередь")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Берет в аренду следующую задачу.
+
+        Подходят ожидающие задачи и задачи, аренда которых истекла
+        (воркер упал или был перезапущен, не завершив работу).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE сериализует выбор задачи между воркерами
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs "
+                    "WHERE (status = 'pending' AND available_at <= ?) "
+                    "   OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                        "lease_expires = ?, worker_id = ?, updated_at = ? WHERE id = ?",
+                        (now + self.lease_seconds, worker_id, now, row['id'])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        if row['status'] == 'running':
+            logger.warning(f"Задача {row['id']} подхвачена после истечения аренды ({row['worker_id']})")
+        return {
+            'id': row['id'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1
+        }
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Продлевает аренду задачи. False - задачу уже забрал другой воркер"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str):
+        """Отмечает задачу выполненной"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            )
+
+    def fail(self, job_id: int, worker_id: str, error: str, attempts: int) -> bool:
+        """Отмечает неудачную попытку.
+
+        Возвращает True, если задача будет повторена, и False, если попытки
+        исчерпаны и задача окончательно провалена.
+        """
+        now = time.time()
+        retry = attempts < self.max_attempts
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_expires = NULL, "
+                "error = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                ('pending' if retry else 'failed', now + self.retry_delay,
+                 error, now, job_id, worker_id)
+            )
+        return retry
+
+    def cancel(self, chat_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+        """Отменяет задачу по сообщению со статусом обработки.
+
+        Возвращает {'id', 'status', 'payload'} со статусом задачи до отмены
+        или None, если активной задачи для этого сообщения нет.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, status, payload FROM jobs "
+                    "WHERE status IN ('pending', 'running') "
+                    "  AND json_extract(payload, '$.chat_id') = ? "
+                    "  AND json_extract(payload, '$.message_id') = ? "
+                    "ORDER BY id DESC LIMIT 1",
+                    (chat_id, message_id)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'cancelled', lease_expires = NULL, "
+                        "updated_at = ? WHERE id = ?",
+                        (now, row['id'])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        logger.info(f"Задача {row['id']} отменена пользователем")
+        return {'id': row['id'], 'status': row['status'], 'payload': json.loads(row['payload'])}
+
+    def is_cancelled(self, job_id: int) -> bool:
+        """Проверяет, отменена ли задача"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row['status'] == 'cancelled'
+
+    def purge_finished(self, max_age: int = 24 * 3600) -> int:
+        """Удаляет старые завершенные задачи"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated_at < ?",
+                (time.time() - max_age,)
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает количество задач по статусам"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
@@ -0,0 +1,75 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Исходы, при которых задача дошла до конвертации и годится для воспроизведения
+CONVERTED_OUTCOMES = ('ok', 'timeout', 'memory', 'cancelled', 'error')
+
+class TraceRecorder:
+    """Запись трасс задач в JSONL для планирования мощностей (replay.py).
+
+    Трасса анонимна: в нее попадают только характеристики задачи - размер,
+    страницы, тип конвертации, найденные изображения и таблицы, время по
+    этапам, пиковая память и исход. Идентификаторы пользователей и чатов,
+    имена файлов и содержимое не записываются.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build(job: dict, waits: Dict[str, float], busy: Dict[str, float]) -> dict:
+        """Собирает анонимную трассу задачи"""
+        preflight = job.get('preflight') or {}
+        if job.get('outcome'):
+            outcome = job['outcome']
+        elif job.get('rejection'):
+            outcome = 'rejected'
+        else:
+            outcome = 'ok' if 'convert' in busy else 'not_converted'
+        return {
+            'ts': round(time.time()),
+            'type': job['type'],
+            # Размер с точностью до килобайта, чтобы трасса не выдавала файл
+            'size_kb': round(job.get('file_size', 0) / 1024),
+            'pages': preflight.get('pages'),
+            'scan_pages': preflight.get('image_pages'),
+            'images': preflight.get('images'),
+            'fonts': preflight.get('fonts'),
+            'tables': job.get('tables'),
+            'estimate': round(job['estimate'], 2) if 'estimate' in job else None,
+            'waits': {stage: round(seconds, 3) for stage, seconds in waits.items()},
+            'stages': {stage: round(seconds, 3) for stage, seconds in busy.items()},
+            'peak_rss_mb': round(job.get('worker_stats', {}).get('peak_rss_mb', 0)),
+            'outcome': outcome
+        }
+
+    def record(self, job: dict, waits: Dict[str, float], busy: Dict[str, float]):
+        """Дописывает трассу задачи в файл"""
+        try:
+            line = json.dumps(self.build(job, waits, busy)) + '\n'
+            with self._lock, open(self.path, 'a', encoding='utf-8') as trace_file:
+                trace_file.write(line)
+        except Exception as e:
+            logger.error(f"Ошибка записи трассы задачи: {e}")
+
+def load_traces(path: str) -> List[dict]:
+    """Читает трассы из JSONL, пропуская поврежденные строки"""
+    traces = []
+    with open(path, encoding='utf-8') as trace_file:
+        for line_number, line in enumerate(trace_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                traces.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Пропущена поврежденная трасса в строке {line_number}")
+    return traces
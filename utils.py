@@ -1,10 +1,17 @@
 import os
+import json
 import logging
+import asyncio
+import sqlite3
 from pathlib import Path
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
 import hashlib
 import time
 
+from config import MAX_FILE_SIZE
+
 logger = logging.getLogger(__name__)
 
 class FileManager:
@@ -42,7 +49,8 @@ class FileManager:
         except Exception:
             return 0.0
     
-    def format_file_size(self, size_bytes: int) -> str:
+    @staticmethod
+    def format_file_size(size_bytes: int) -> str:
         """Форматирует размер файла в читаемый вид"""
         if size_bytes < 1024:
             return f"{size_bytes} B"
@@ -53,97 +61,348 @@ class FileManager:
         else:
             return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
 
-class UserSession:
-    """Класс для управления сессиями пользователей"""
+class Session:
+    """Состояние пользователя между сообщениями"""
     
-    def __init__(self):
-        self.sessions: Dict[int, Dict[str, Any]] = {}
-        self.max_session_age = 3600  # 1 час в секундах
+    __slots__ = ('current_file', 'batch', 'expires_at')
     
-    def create_session(self, user_id: int) -> Dict[str, Any]:
-        """Создает новую сессию для пользователя"""
-        session = {
-            'created_at': time.time(),
-            'files_processed': 0,
-            'last_activity': time.time()
-        }
-        self.sessions[user_id] = session
-        return session
+    FIELDS = ('current_file', 'batch')
+    
+    def __init__(self, current_file: Optional[dict] = None, batch: Optional[dict] = None,
+                 expires_at: float = 0.0):
+        self.current_file = current_file
+        self.batch = batch
+        self.expires_at = expires_at
+    
+    def is_empty(self) -> bool:
+        return self.current_file is None and self.batch is None
+
+class SessionStore:
+    """Ограниченное хранилище сессий пользователей с истечением по TTL.
+
+    Сессия продлевается при каждой записи и истекает через ttl секунд
+    без изменений. Записи упорядочены по времени продления, поэтому
+    истекшие и лишние сверх max_entries удаляются с начала словаря за O(1).
+    С db_path сессии пишутся в SQLite и переживают перезапуск, а в памяти
+    остаются только cache_entries недавних.
+
+    Вложенные словари (файл, пакет) после изменения на месте нужно
+    сохранить через set, иначе изменения не попадут на диск.
+    """
     
-    def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получает сессию пользователя"""
-        if user_id in self.sessions:
-            session = self.sessions[user_id]
-            # Проверяем, не истекла ли сессия
-            if time.time() - session['created_at'] < self.max_session_age:
-                session['last_activity'] = time.time()
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000,
+                 db_path: Optional[str] = None, cache_entries: int = 1000,
+                 cleanup_every: int = 100):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = Path(db_path) if db_path else None
+        # Без диска память - единственное хранилище и ограничена max_entries
+        self.cache_entries = min(cache_entries, max_entries) if self.db_path else max_entries
+        self.cleanup_every = cleanup_every
+        self.sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._writes = 0
+        if self.db_path:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._init_db()
+    
+    @contextmanager
+    def _connect(self):
+        """Открывает соединение с базой (по одному на операцию)"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def _init_db(self):
+        """Создает таблицу сессий"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires_idx ON sessions (expires_at)"
+            )
+    
+    def _evict(self, now: float):
+        """Удаляет из памяти истекшие сессии и сессии сверх лимита"""
+        while self.sessions:
+            user_id, session = next(iter(self.sessions.items()))
+            if session.expires_at > now and len(self.sessions) <= self.cache_entries:
+                break
+            del self.sessions[user_id]
+    
+    def _load(self, user_id: int, now: float) -> Optional[Session]:
+        """Находит действующую сессию в памяти или на диске"""
+        session = self.sessions.get(user_id)
+        if session is not None:
+            if session.expires_at > now:
                 return session
-            else:
-                # Удаляем истекшую сессию
-                del self.sessions[user_id]
-        return None
+            del self.sessions[user_id]
+            return None
+        if not self.db_path:
+            return None
+        
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT data, expires_at FROM sessions WHERE user_id = ? AND expires_at > ?",
+                    (user_id, now)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка чтения сессии пользователя {user_id}: {e}")
+            return None
+        if row is None:
+            return None
+        
+        session = Session(expires_at=row[1], **json.loads(row[0]))
+        self.sessions[user_id] = session
+        self._evict(now)
+        return session
     
-    def update_session(self, user_id: int, **kwargs):
-        """Обновляет данные сессии"""
-        session = self.get_session(user_id)
-        if session:
-            session.update(kwargs)
-            session['last_activity'] = time.time()
-    
-    def cleanup_expired_sessions(self):
-        """Удаляет истекшие сессии"""
-        current_time = time.time()
-        expired_users = []
+    def _save(self, user_id: int, session: Session):
+        """Записывает сессию на диск или удаляет пустую"""
+        try:
+            with self._connect() as conn:
+                if session.is_empty():
+                    conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                else:
+                    data = {field: getattr(session, field) for field in Session.FIELDS}
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+                        (user_id, json.dumps(data, ensure_ascii=False), session.expires_at)
+                    )
+        except Exception as e:
+            logger.error(f"Ошибка сохранения сессии пользователя {user_id}: {e}")
+            return
         
-        for user_id, session in self.sessions.items():
-            if current_time - session['created_at'] > self.max_session_age:
-                expired_users.append(user_id)
+        self._writes += 1
+        if self._writes % self.cleanup_every == 0:
+            self.cleanup()
+    
+    def get(self, user_id: int, field: str) -> Any:
+        """Возвращает поле сессии пользователя (None, если сессии нет)"""
+        session = self._load(user_id, time.time())
+        return getattr(session, field) if session else None
+    
+    def set(self, user_id: int, field: str, value: Any):
+        """Записывает поле сессии и продлевает ее"""
+        now = time.time()
+        session = self._load(user_id, now)
+        if session is None:
+            if value is None:
+                return
+            session = Session()
+        setattr(session, field, value)
+        session.expires_at = now + self.ttl
         
-        for user_id in expired_users:
-            del self.sessions[user_id]
-            logger.info(f"Удалена истекшая сессия пользователя {user_id}")
+        if session.is_empty():
+            self.sessions.pop(user_id, None)
+        else:
+            self.sessions[user_id] = session
+            self.sessions.move_to_end(user_id)
+            self._evict(now)
+        if self.db_path:
+            self._save(user_id, session)
+    
+    def pop(self, user_id: int, field: str) -> Any:
+        """Забирает поле сессии, удаляя его"""
+        value = self.get(user_id, field)
+        if value is not None:
+            self.set(user_id, field, None)
+        return value
+    
+    def clear(self, user_id: int):
+        """Удаляет сессию пользователя целиком"""
+        self.sessions.pop(user_id, None)
+        if self.db_path:
+            self._save(user_id, Session())
+    
+    def cleanup(self) -> int:
+        """Удаляет истекшие сессии и сессии сверх max_entries на диске"""
+        now = time.time()
+        self._evict(now)
+        if not self.db_path:
+            return 0
+        try:
+            with self._connect() as conn:
+                removed = conn.execute(
+                    "DELETE FROM sessions WHERE expires_at <= ?", (now,)
+                ).rowcount
+                removed += conn.execute(
+                    "DELETE FROM sessions WHERE user_id IN ("
+                    "  SELECT user_id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+            return removed
+        except Exception as e:
+            logger.error(f"Ошибка очистки сессий: {e}")
+            return 0
+    
+    def __len__(self) -> int:
+        return len(self.sessions)
 
 class RateLimiter:
-    """Класс для ограничения частоты запросов"""
+    """Ограничение нагрузки на пользователя по алгоритму token bucket.
+
+    Квота считается в единицах стоимости (оценочные CPU-секунды конвертации),
+    а не в количестве запросов, поэтому один тяжелый пользователь не может
+    занять все воркеры. Проверка выполняется за O(1): на пользователя
+    хранится только (остаток, время обновления). Записи упорядочены по
+    времени обновления, и записи простаивающих пользователей (бакет которых
+    уже полностью восстановился) удаляются с начала словаря.
+    """
     
-    def __init__(self, max_requests: int = 10, time_window: int = 3600):
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests: Dict[int, list] = {}
+    def __init__(self, capacity: float = 900, refill_per_hour: float = 900):
+        self.capacity = capacity
+        self.refill_rate = refill_per_hour / 3600
+        # Долг ограничен -capacity, поэтому через это время бакет
+        # гарантированно полон и запись можно забыть
+        self.idle_ttl = 2 * capacity / self.refill_rate if self.refill_rate else float('inf')
+        self.buckets: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
     
-    def is_allowed(self, user_id: int) -> bool:
-        """Проверяет, разрешен ли запрос пользователю"""
-        current_time = time.time()
-        
-        if user_id not in self.requests:
-            self.requests[user_id] = []
-        
-        # Удаляем старые запросы
-        self.requests[user_id] = [
-            req_time for req_time in self.requests[user_id]
-            if current_time - req_time < self.time_window
-        ]
-        
-        # Проверяем лимит
-        if len(self.requests[user_id]) >= self.max_requests:
+    def _evict_idle(self, now: float):
+        """Удаляет записи пользователей, чьи бакеты уже восстановились"""
+        while self.buckets:
+            user_id, (_, updated_at) = next(iter(self.buckets.items()))
+            if now - updated_at < self.idle_ttl:
+                break
+            del self.buckets[user_id]
+    
+    def _available(self, user_id: int, now: float) -> float:
+        """Текущий остаток квоты пользователя"""
+        state = self.buckets.get(user_id)
+        if state is None:
+            return self.capacity
+        tokens, updated_at = state
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+    
+    def try_consume(self, user_id: int, cost: float = 1.0) -> bool:
+        """Списывает стоимость задачи, если квоты хватает.
+
+        Задача дороже всей квоты разрешается при полном бакете и уводит
+        остаток в минус - следующая задача будет возможна после восстановления.
+        """
+        now = time.monotonic()
+        self._evict_idle(now)
+        tokens = self._available(user_id, now)
+        if tokens < min(cost, self.capacity):
             return False
-        
-        # Добавляем текущий запрос
-        self.requests[user_id].append(current_time)
+        self.buckets[user_id] = (max(tokens - cost, -self.capacity), now)
+        self.buckets.move_to_end(user_id)
         return True
     
+    def has_budget(self, user_id: int) -> bool:
+        """Проверяет, что у пользователя осталась хоть какая-то квота"""
+        return self._available(user_id, time.monotonic()) > 0
+    
+    def retry_after(self, user_id: int, cost: float = 1.0) -> float:
+        """Через сколько секунд станет доступна задача указанной стоимости"""
+        missing = min(cost, self.capacity) - self._available(user_id, time.monotonic())
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_rate if self.refill_rate else float('inf')
+    
+    def is_allowed(self, user_id: int) -> bool:
+        """Проверяет, разрешен ли запрос пользователю (стоимость 1)"""
+        return self.try_consume(user_id, 1.0)
+    
     def get_remaining_requests(self, user_id: int) -> int:
-        """Возвращает количество оставшихся запросов"""
-        if user_id not in self.requests:
-            return self.max_requests
-        
-        current_time = time.time()
-        valid_requests = [
-            req_time for req_time in self.requests[user_id]
-            if current_time - req_time < self.time_window
+        """Возвращает оставшуюся квоту пользователя"""
+        return max(0, int(self._available(user_id, time.monotonic())))
+
+class EditThrottle:
+    """Ограничивает частоту правок сообщений в одном чате (flood limits Telegram)"""
+    
+    def __init__(self, interval: float = 3.0):
+        self.interval = interval
+        self.last_edit: OrderedDict = OrderedDict()  # chat_id -> время последней правки
+    
+    def delay(self, chat_id: int) -> float:
+        """Сколько секунд нужно подождать до следующей правки в чате"""
+        last = self.last_edit.get(chat_id)
+        if last is None:
+            return 0.0
+        return max(0.0, last + self.interval - time.monotonic())
+    
+    def mark(self, chat_id: int):
+        """Отмечает правку сообщения в чате"""
+        now = time.monotonic()
+        self.last_edit[chat_id] = now
+        self.last_edit.move_to_end(chat_id)
+        # Старые отметки уже ни на что не влияют
+        while self.last_edit:
+            oldest_chat, oldest = next(iter(self.last_edit.items()))
+            if now - oldest < self.interval:
+                break
+            del self.last_edit[oldest_chat]
+
+class ProgressReporter:
+    """Превращает постраничный прогресс конвертации в редкие правки статуса.
+
+    Обновления объединяются: пока ждет отложенная правка, новые данные
+    только запоминаются, и в сообщение попадает самое свежее состояние.
+    Несколько этапов (например, Word и таблицы) показываются вместе.
+    """
+    
+    def __init__(self, edit: Callable[[str], Awaitable[Any]], throttle: EditThrottle,
+                 chat_id: int, title: str):
+        self.edit = edit
+        self.throttle = throttle
+        self.chat_id = chat_id
+        self.title = title
+        self.started = time.monotonic()
+        self.stages: Dict[str, Tuple[int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def callback(self, stage: str = '') -> Callable[[int, int], None]:
+        """Callback прогресса для одного этапа конвертации"""
+        return lambda done, total: self.update(stage, done, total)
+    
+    def update(self, stage: str, done: int, total: int):
+        """Запоминает прогресс этапа и планирует правку сообщения"""
+        self.stages[stage] = (done, total)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+    
+    async def _flush(self):
+        """Отправляет правку, когда это позволяет ограничение чата"""
+        await asyncio.sleep(self.throttle.delay(self.chat_id))
+        self.throttle.mark(self.chat_id)
+        try:
+            await self.edit(self.render())
+        except Exception as e:
+            logger.error(f"Ошибка обновления прогресса: {e}")
+    
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени по самому медленному этапу"""
+        elapsed = time.monotonic() - self.started
+        remaining = [
+            elapsed / done * (total - done)
+            for done, total in self.stages.values() if done
         ]
-        
-        return max(0, self.max_requests - len(valid_requests))
+        return max(remaining) if remaining else None
+    
+    def render(self) -> str:
+        """Текст сообщения о прогрессе"""
+        lines = [f"⏳ {self.title}"]
+        for stage, (done, total) in self.stages.items():
+            label = f"{stage}: " if stage else ""
+            lines.append(f"📄 {label}{done} из {total} стр.")
+        eta = self.eta()
+        if eta:
+            lines.append(f"⏱ Осталось: ~{format_duration(eta)}")
+        return "\n".join(lines)
+    
+    def close(self):
+        """Отменяет отложенную правку (перед итоговым статусом)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
 
 def validate_pdf_file(file_path: str) -> Dict[str, Any]:
     """Валидирует PDF файл и возвращает информацию о нем"""
@@ -164,8 +423,8 @@ def validate_pdf_file(file_path: str) -> Dict[str, Any]:
         file_size = os.path.getsize(file_path)
         result['size_mb'] = file_size / (1024 * 1024)
         
-        if result['size_mb'] > 20:  # 20MB лимит
-            result['error'] = "Файл слишком большой (максимум 20MB)"
+        if file_size > MAX_FILE_SIZE:
+            result['error'] = f"Файл слишком большой (максимум {MAX_FILE_SIZE // (1024 * 1024)}MB)"
             return result
         
         # Проверяем, что это PDF
@@ -203,3 +462,45 @@ def sanitize_filename(filename: str) -> str:
         name, ext = os.path.splitext(sanitized)
         sanitized = name[:95] + ext
     return sanitized
+
+def format_duration(seconds: float) -> str:
+    """Форматирует длительность в читаемый вид"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{max(seconds, 1)} сек"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} мин {seconds} сек" if seconds else f"{minutes} мин"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин"
+
+def parse_page_range(text: str) -> Optional[Tuple[int, Optional[int]]]:
+    """Разбирает диапазон страниц вида "5-12", "5" или "5-".
+
+    Возвращает (start, end) в нумерации с нуля, end не включается
+    (None - до конца документа), или None, если текст не является диапазоном.
+    """
+    import re
+    match = re.fullmatch(r'\s*(\d+)\s*(?:([-–—])\s*(\d*))?\s*', text)
+    if not match:
+        return None
+    first = int(match.group(1))
+    if first < 1:
+        return None
+    if not match.group(2):
+        return first - 1, first
+    if not match.group(3):
+        return first - 1, None
+    last = int(match.group(3))
+    if last < first:
+        return None
+    return first - 1, last
+
+def format_page_range(page_range) -> str:
+    """Форматирует диапазон страниц (start, end) для пользователя"""
+    start, end = page_range
+    if end is None:
+        return f"с {start + 1} до конца"
+    if end - start == 1:
+        return f"{start + 1}"
+    return f"{start + 1}–{end}"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Воркер очереди конвертации.
+
+Забирает задачи из ConversionQueue, выполняет конвертацию и отправляет
+результат пользователю напрямую через Bot API. Можно запускать несколько
+воркеров, в том числе на других узлах с общим TEMP_DIR и файлом очереди.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from telegram import Bot
+
+from config import BOT_TOKEN, QUEUE_SETTINGS
+from bot import PDFBot, bot_api_options
+from task_queue import ConversionQueue
+
+logger = logging.getLogger(__name__)
+
+async def _keep_lease(queue: ConversionQueue, job_id: int, worker_id: str):
+    """Продлевает аренду задачи, пока идет конвертация"""
+    interval = max(1, queue.lease_seconds // 3)
+    while True:
+        await asyncio.sleep(interval)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id):
+            logger.warning(f"Аренда задачи {job_id} потеряна")
+            return
+
+async def _watch_cancel(queue: ConversionQueue, job_id: int, cancel: asyncio.Event):
+    """Следит, не остановил ли пользователь задачу"""
+    while not cancel.is_set():
+        await asyncio.sleep(QUEUE_SETTINGS['poll_interval'])
+        if await asyncio.to_thread(queue.is_cancelled, job_id):
+            logger.info(f"Задача {job_id} отменена, останавливаю конвертацию")
+            cancel.set()
+
+async def run_worker(worker_id: str):
+    """Основной цикл воркера"""
+    queue = ConversionQueue(QUEUE_SETTINGS['db_path'])
+    pdf_bot = PDFBot()
+    pdf_bot.pool.start()
+
+    try:
+        async with Bot(BOT_TOKEN, **bot_api_options()) as bot:
+            logger.info(f"Воркер {worker_id} запущен, очередь: {queue.stats()}")
+            await _process_jobs(queue, pdf_bot, bot, worker_id)
+    finally:
+        pdf_bot.pool.close()
+
+async def _process_jobs(queue: ConversionQueue, pdf_bot: PDFBot, bot: Bot, worker_id: str):
+    """Забирает задачи из очереди и выполняет их"""
+    purged_at = 0.0
+    while True:
+        if time.monotonic() - purged_at >= QUEUE_SETTINGS['purge_interval']:
+            # Иначе таблица задач растет без ограничений
+            purged_at = time.monotonic()
+            purged = await asyncio.to_thread(queue.purge_finished, QUEUE_SETTINGS['purge_age'])
+            if purged:
+                logger.info(f"Удалено завершенных задач: {purged}")
+        
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            await asyncio.sleep(QUEUE_SETTINGS['poll_interval'])
+            continue
+
+        payload = job['payload']
+        logger.info(f"Задача {job['id']} ({payload['type']}), попытка {job['attempts']}")
+        finished = True
+
+        if job['attempts'] > queue.max_attempts:
+            # Задача несколько раз терялась вместе с воркером - больше не пытаемся
+            await asyncio.to_thread(queue.fail, job['id'], worker_id,
+                                    'attempts exhausted', job['attempts'])
+            await pdf_bot._edit_status(
+                bot, payload,
+                "❌ Не удалось обработать файл!\n"
+                "Попробуйте еще раз или обратитесь к администратору."
+            )
+        elif not Path(payload['pdf_path']).exists():
+            await asyncio.to_thread(queue.fail, job['id'], worker_id,
+                                    'pdf not found', queue.max_attempts)
+            await pdf_bot._edit_status(bot, payload, "❌ Файл не найден! Отправьте PDF еще раз.")
+        else:
+            cancel = pdf_bot._cancel_token(payload)
+            pipeline_job = pdf_bot.pipeline.track()
+            lease = asyncio.create_task(_keep_lease(queue, job['id'], worker_id))
+            watch = asyncio.create_task(_watch_cancel(queue, job['id'], cancel))
+            # Сбой процесса конвертации и таймаут обработчики пробрасывают сюда,
+            # пока у задачи остаются попытки; остальные ошибки сообщают сами
+            payload['retriable'] = job['attempts'] < queue.max_attempts
+            try:
+                await pdf_bot.process_job(bot, payload)
+                await asyncio.to_thread(queue.complete, job['id'], worker_id)
+            except Exception as e:
+                logger.error(f"Ошибка выполнения задачи {job['id']}: {e}")
+                finished = not await asyncio.to_thread(
+                    queue.fail, job['id'], worker_id, f"{type(e).__name__}: {e}", job['attempts']
+                )
+                if not finished:
+                    await pdf_bot._edit_status(
+                        bot, payload,
+                        "⏳ Не удалось обработать файл, задача будет повторена...",
+                        final=False
+                    )
+                else:
+                    await pdf_bot._edit_status(
+                        bot, payload,
+                        "❌ Произошла ошибка при обработке файла!\n"
+                        "Попробуйте еще раз или обратитесь к администратору."
+                    )
+            finally:
+                lease.cancel()
+                watch.cancel()
+                pdf_bot._drop_cancel_token(payload)
+                pdf_bot._finish_job(payload, pipeline_job)
+
+        if finished and payload.get('owns_pdf'):
+            pdf_bot.converter.cleanup_temp_files(payload['pdf_path'])
+
+def main():
+    """Точка входа воркера"""
+    if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
+        print("❌ Ошибка: Не установлен токен бота!")
+        return
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        asyncio.run(run_worker(worker_id))
+    except KeyboardInterrupt:
+        print("\n👋 Воркер остановлен")
+
+if __name__ == '__main__':
+    main()
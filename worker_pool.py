@@ -0,0 +1,287 @@
+import asyncio
+import gc
+import logging
+import multiprocessing as mp
+import os
+import time
+from typing import Callable, List, Optional
+
+from config import WORKER_SETTINGS, PROGRESS_SETTINGS
+from pdf_converter import ConversionCancelled
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+class MemoryLimitExceeded(Exception):
+    """Задача превысила лимит памяти воркера"""
+
+class WorkerError(Exception):
+    """Воркер завершился с ошибкой при выполнении задачи"""
+
+def _rss_mb(pid: int) -> float:
+    """Возвращает резидентную память процесса в мегабайтах (Linux)"""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def _progress_sender(conn, interval: float):
+    """Создает callback прогресса, пересылающий его пулу не чаще раза в interval секунд"""
+    last_sent = 0.0
+
+    def send(done: int, total: int):
+        nonlocal last_sent
+        now = time.monotonic()
+        if done >= total or now - last_sent >= interval:
+            last_sent = now
+            conn.send(('progress', done, total))
+
+    return send
+
+def _worker_main(conn, cancel_event, temp_dir: str, address_space_limit_mb: int, prewarm: bool):
+    """Цикл процесса-воркера: выполняет методы PDFConverter по запросу пула"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if resource and address_space_limit_mb:
+        # Жесткий лимит: при его превышении аллокации падают с MemoryError
+        limit = address_space_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    from pdf_converter import PDFConverter
+    converter = PDFConverter(temp_dir)
+    if prewarm:
+        # Платим за импорт тяжелых библиотек до первой задачи
+        conn.send(('ready', converter.warm_up()))
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+
+        method, args, kwargs, report_progress, cancellable = task
+        if report_progress:
+            kwargs['progress_callback'] = _progress_sender(conn, PROGRESS_SETTINGS['worker_interval'])
+        if cancellable:
+            # Пул взводит событие, конвертер проверяет его между страницами
+            kwargs['cancel_check'] = cancel_event.is_set
+        try:
+            result = getattr(converter, method)(*args, **kwargs)
+            conn.send(('ok', result))
+        except ConversionCancelled:
+            conn.send(('cancelled', None))
+        except MemoryError:
+            conn.send(('memory', None))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+        finally:
+            gc.collect()
+
+class _Worker:
+    """Процесс-воркер и канал связи с ним"""
+
+    def __init__(self, ctx, temp_dir: str, address_space_limit_mb: int, prewarm: bool):
+        self.conn, child_conn = ctx.Pipe()
+        self.cancel_event = ctx.Event()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.cancel_event, temp_dir, address_space_limit_mb, prewarm),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+
+    def rss_mb(self) -> float:
+        return _rss_mb(self.process.pid)
+
+    def stop(self, timeout: float = 5):
+        """Корректно завершает воркер"""
+        try:
+            self.conn.send(None)
+            self.process.join(timeout)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        """Немедленно завершает воркер (таймаут, превышение памяти, отмена)"""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class ConversionPool:
+    """Пул процессов для конвертации с контролем памяти.
+
+    Каждая задача выполняется в отдельном процессе. Если память процесса
+    превышает memory_limit_mb, процесс завершается, а задача падает с
+    MemoryLimitExceeded - остальные задачи не затрагиваются. Воркеры
+    перезапускаются после recycle_after_jobs задач или при разрастании
+    до recycle_rss_mb, чтобы утечки pdf2docx/pdfplumber не копились.
+    """
+
+    def __init__(self, temp_dir: str,
+                 workers: int = WORKER_SETTINGS['workers'],
+                 memory_limit_mb: int = WORKER_SETTINGS['memory_limit_mb'],
+                 address_space_limit_mb: int = WORKER_SETTINGS['address_space_limit_mb'],
+                 recycle_after_jobs: int = WORKER_SETTINGS['recycle_after_jobs'],
+                 recycle_rss_mb: int = WORKER_SETTINGS['recycle_rss_mb'],
+                 prewarm: bool = WORKER_SETTINGS['prewarm'],
+                 poll_interval: float = 0.2):
+        self.temp_dir = temp_dir
+        self.workers = max(1, workers)
+        self.memory_limit_mb = memory_limit_mb
+        self.address_space_limit_mb = address_space_limit_mb
+        self.recycle_after_jobs = recycle_after_jobs
+        self.recycle_rss_mb = recycle_rss_mb
+        self.prewarm = prewarm
+        self.poll_interval = poll_interval
+        self._ctx = mp.get_context('spawn')
+        self._idle: List[_Worker] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.temp_dir, self.address_space_limit_mb, self.prewarm)
+
+    def start(self):
+        """Запускает и прогревает воркеры заранее (в фоне, без ожидания)"""
+        if not self.prewarm:
+            return
+        while len(self._idle) < self.workers:
+            self._idle.append(self._spawn())
+        logger.info(f"Запущено {self.workers} воркеров конвертации, идет прогрев")
+
+    async def run(self, method: str, *args, timeout: float,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  cancel: Optional[asyncio.Event] = None,
+                  stats: Optional[dict] = None, **kwargs):
+        """Выполняет метод PDFConverter в воркере.
+
+        Бросает asyncio.TimeoutError по истечении timeout и
+        MemoryLimitExceeded при превышении лимита памяти. Если передан
+        progress, он вызывается в цикле событий с (страниц готово, всего).
+        Если взведено событие cancel, конвертер останавливается на ближайшей
+        странице и бросается ConversionCancelled. В словарь stats, если он
+        передан, записывается пиковая память воркера (peak_rss_mb).
+        """
+        if self._slots is None:
+            # Семафор создается внутри работающего цикла событий
+            self._slots = asyncio.Semaphore(self.workers)
+
+        async with self._slots:
+            if cancel and cancel.is_set():
+                # Задачу остановили, пока она ждала свободный воркер
+                raise ConversionCancelled(method)
+            worker = self._idle.pop() if self._idle else self._spawn()
+            try:
+                worker.cancel_event.clear()
+                worker.conn.send((method, args, kwargs, progress is not None, cancel is not None))
+                status, result = await self._wait(worker, timeout, progress, cancel, stats)
+            except BaseException:
+                # Таймаут, превышение памяти или отмена корутины:
+                # процесс мог остаться в любом состоянии, поэтому завершаем его
+                worker.kill()
+                if self.prewarm:
+                    self._idle.insert(0, self._spawn())
+                raise
+
+            worker.jobs_done += 1
+            self._release(worker, recycle=(status == 'memory'))
+
+        if status == 'memory':
+            raise MemoryLimitExceeded(method)
+        if status == 'cancelled':
+            raise ConversionCancelled(method)
+        if status == 'error':
+            raise WorkerError(result)
+        return result
+
+    @staticmethod
+    def _raise_exit(worker: _Worker):
+        """Сообщает о завершившемся воркере исключением по коду завершения"""
+        # SIGKILL обычно означает OOM killer
+        if worker.process.exitcode == -9:
+            raise MemoryLimitExceeded('killed')
+        raise WorkerError(f"Воркер завершился с кодом {worker.process.exitcode}")
+
+    async def _wait(self, worker: _Worker, timeout: float,
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    cancel: Optional[asyncio.Event] = None,
+                    stats: Optional[dict] = None):
+        """Ждет ответа воркера, следя за временем, памятью и отменой"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        cancel_deadline = None
+        while True:
+            if worker.conn.poll():
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    # Процесс убит, пока ответ не был отправлен: poll() видит
+                    # закрытый канал. Дожидаемся кода завершения процесса
+                    await asyncio.to_thread(worker.process.join, WORKER_SETTINGS['cancel_grace'])
+                    self._raise_exit(worker)
+                if message[0] == 'ready':
+                    logger.info(f"Воркер {worker.process.pid} прогрет за {message[1]:.1f} сек")
+                elif message[0] == 'progress':
+                    if progress:
+                        progress(*message[1:])
+                else:
+                    if stats is not None:
+                        # Быстрая задача могла завершиться до первого замера
+                        stats['peak_rss_mb'] = max(stats.get('peak_rss_mb', 0.0), worker.rss_mb())
+                    return message
+                continue
+            if not worker.process.is_alive():
+                self._raise_exit(worker)
+            if self.memory_limit_mb or stats is not None:
+                rss = worker.rss_mb()
+                if stats is not None:
+                    stats['peak_rss_mb'] = max(stats.get('peak_rss_mb', 0.0), rss)
+                if self.memory_limit_mb and rss > self.memory_limit_mb:
+                    logger.warning(f"Воркер {worker.process.pid} превысил лимит памяти: {rss:.0f}MB")
+                    raise MemoryLimitExceeded(f"{rss:.0f}MB")
+            if cancel and cancel.is_set():
+                if cancel_deadline is None:
+                    worker.cancel_event.set()
+                    cancel_deadline = loop.time() + WORKER_SETTINGS['cancel_grace']
+                elif loop.time() > cancel_deadline:
+                    # Страница разбирается слишком долго - завершаем процесс
+                    raise ConversionCancelled('killed')
+            if loop.time() > deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(self.poll_interval)
+
+    def _release(self, worker: _Worker, recycle: bool = False):
+        """Возвращает воркер в пул или перезапускает его"""
+        rss = worker.rss_mb()
+        if (recycle or
+                (self.recycle_after_jobs and worker.jobs_done >= self.recycle_after_jobs) or
+                (self.recycle_rss_mb and rss > self.recycle_rss_mb)):
+            logger.info(
+                f"Перезапуск воркера {worker.process.pid}: "
+                f"{worker.jobs_done} задач, {rss:.0f}MB"
+            )
+            asyncio.get_running_loop().run_in_executor(None, worker.stop)
+            if self.prewarm:
+                # Сразу готовим замену, чтобы следующая задача не ждала импорта
+                self._idle.insert(0, self._spawn())
+            return
+        self._idle.append(worker)
+
+    def close(self):
+        """Останавливает все свободные воркеры"""
+        while self._idle:
+            self._idle.pop().stop()